@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import numpy.typing as npt
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cs336_basics.data.shard import TokenShard, is_shard
+
+
+def sample_windows(
+    tokens: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    generator: np.random.Generator | None = None,
+    out: npt.NDArray | None = None,
+) -> npt.NDArray:
+    """
+    Sample `batch_size` random windows of `context_length + 1` tokens.
+
+    The windows are gathered with one fancy-indexing call on a strided view of
+    `tokens`, so for a memmapped array only the touched pages are read. When
+    `out` is given (same dtype as `tokens`), the windows are written into it
+    instead of a new array.
+
+    Returns:
+        npt.NDArray: (batch_size, context_length + 1) array with the dtype of `tokens`
+    """
+    if len(tokens) <= context_length:
+        raise ValueError(
+            f"Dataset of {len(tokens)} tokens is too short for context_length {context_length}"
+        )
+
+    rng = generator if generator is not None else np.random.default_rng()
+    windows = sliding_window_view(tokens, context_length + 1)
+    starts = rng.integers(0, len(windows), size=batch_size)
+    if out is None:
+        return windows[starts]
+    # mode="clip" lets NumPy write into `out` directly instead of buffering;
+    # every start is in range anyway.
+    return np.take(windows, starts, axis=0, out=out, mode="clip")
+
+
+def sample_document_windows(
+    tokens: npt.NDArray,
+    doc_starts: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    generator: np.random.Generator | None = None,
+    out: npt.NDArray | None = None,
+) -> npt.NDArray:
+    """
+    Like `sample_windows`, but every window starts at a document start. Only
+    the sorted `doc_starts` index is consulted, the tokens are never scanned.
+    """
+    # Documents starting at or after this offset have no full window left.
+    num_valid = int(np.searchsorted(doc_starts, len(tokens) - context_length))
+    if num_valid == 0:
+        raise ValueError(
+            f"No document starts a full window of context_length {context_length}"
+        )
+
+    rng = generator if generator is not None else np.random.default_rng()
+    windows = sliding_window_view(tokens, context_length + 1)
+    starts = doc_starts[rng.integers(0, num_valid, size=batch_size)].astype(np.int64)
+    if out is None:
+        return windows[starts]
+    return np.take(windows, starts, axis=0, out=out, mode="clip")
+
+
+def windows_to_batch(
+    windows: npt.NDArray, device: str | torch.device = "cpu"
+) -> tuple[torch.Tensor, torch.Tensor]:
+    batch = torch.from_numpy(windows.astype(np.int64)).to(device)
+    return batch[:, :-1], batch[:, 1:]
+
+
+def get_batch(
+    dataset: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    device: str | torch.device = "cpu",
+    generator: np.random.Generator | None = None,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    windows = sample_windows(dataset, batch_size, context_length, generator)
+    return windows_to_batch(windows, device)
+
+
+class TokenDataset:
+    """
+    A file of token ids written by `encode_file_to_bin` that is memory-mapped
+    instead of read, so memory use does not depend on its size. Shards carry
+    their own dtype and document index; headerless `.bin` files are read with
+    `dtype`.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        context_length: int,
+        dtype: npt.DTypeLike = np.uint16,
+    ) -> None:
+        self.path = path
+        self.context_length = context_length
+        self.shard: TokenShard | None = None
+        self.doc_starts: npt.NDArray | None = None
+        if is_shard(path):
+            self.shard = TokenShard(path)
+            self.tokens = self.shard.tokens
+            if self.shard.num_docs:
+                self.doc_starts = self.shard.doc_starts
+        else:
+            self.tokens = np.memmap(path, dtype=dtype, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    @property
+    def num_windows(self) -> int:
+        return max(0, len(self.tokens) - self.context_length)
+
+    def get_batch(
+        self,
+        batch_size: int,
+        device: str | torch.device = "cpu",
+        generator: np.random.Generator | None = None,
+        document_aligned: bool = False,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        if not document_aligned:
+            return get_batch(
+                self.tokens, batch_size, self.context_length, device, generator
+            )
+        if self.doc_starts is None:
+            raise ValueError(f"{self.path} has no document index")
+        windows = sample_document_windows(
+            self.tokens, self.doc_starts, batch_size, self.context_length, generator
+        )
+        return windows_to_batch(windows, device)
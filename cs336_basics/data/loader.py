@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import numpy.typing as npt
+import torch
+
+from cs336_basics.data.dataset import sample_windows
+
+
+class _Slot:
+    """One preallocated (batch_size, context_length + 1) int64 output buffer."""
+
+    def __init__(self, batch_size: int, context_length: int, pin_memory: bool):
+        self.batch = torch.empty(
+            (batch_size, context_length + 1), dtype=torch.int64, pin_memory=pin_memory
+        )
+        self.array = self.batch.numpy()
+        # Set when the slot was copied to the device with non_blocking=True;
+        # the producer waits on it before overwriting the host buffer.
+        self.copy_done: torch.cuda.Event | None = None
+
+
+class PrefetchLoader:
+    """
+    Sample batches on a background thread so the training step never waits for
+    sampling, dtype conversion or host-to-device copies it could have overlapped.
+
+    Output tensors live in a fixed pool of preallocated (pinned, when the
+    target device is CUDA) buffers. A batch returned by `next()` stays valid
+    until the following call to `next()`, after which its buffer is refilled.
+
+        loader = PrefetchLoader(dataset.tokens, batch_size, context_length, device)
+        for step in range(num_steps):
+            x, y = next(loader)
+            ...
+        print(loader.stats())
+    """
+
+    def __init__(
+        self,
+        tokens: npt.NDArray,
+        batch_size: int,
+        context_length: int,
+        device: str | torch.device = "cpu",
+        prefetch_depth: int = 2,
+        generator: np.random.Generator | None = None,
+    ) -> None:
+        if prefetch_depth < 1:
+            raise ValueError("prefetch_depth must be at least 1")
+
+        self.tokens = tokens
+        self.batch_size = batch_size
+        self.context_length = context_length
+        self.device = torch.device(device)
+        self.generator = generator if generator is not None else np.random.default_rng()
+        pin_memory = self.device.type == "cuda"
+
+        # prefetch_depth slots can sit in the ready queue, one is held by the
+        # consumer and one is being filled by the producer.
+        self._free: queue.Queue[_Slot | None] = queue.Queue()
+        for _ in range(prefetch_depth + 2):
+            self._free.put(_Slot(batch_size, context_length, pin_memory))
+        self._ready: queue.Queue[_Slot | BaseException] = queue.Queue(prefetch_depth)
+        self._scratch = np.empty((batch_size, context_length + 1), dtype=tokens.dtype)
+        self._in_use: _Slot | None = None
+
+        self.wait_time = 0.0
+        self.num_batches = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                slot = self._free.get()
+                if slot is None:
+                    return
+                if slot.copy_done is not None:
+                    slot.copy_done.synchronize()
+                    slot.copy_done = None
+
+                sample_windows(
+                    self.tokens,
+                    self.batch_size,
+                    self.context_length,
+                    self.generator,
+                    out=self._scratch,
+                )
+                np.copyto(slot.array, self._scratch, casting="unsafe")
+                self._put(slot)
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple[torch.Tensor, torch.Tensor]:
+        if self._stop.is_set():
+            raise StopIteration
+        if self._in_use is not None:
+            self._free.put(self._in_use)
+            self._in_use = None
+
+        start = time.perf_counter()
+        item = self._ready.get()
+        self.wait_time += time.perf_counter() - start
+        if isinstance(item, BaseException):
+            self.close()
+            raise item
+
+        self._in_use = item
+        self.num_batches += 1
+        batch = item.batch
+        if self.device.type != "cpu":
+            batch = batch.to(self.device, non_blocking=True)
+            if self.device.type == "cuda":
+                item.copy_done = torch.cuda.Event()
+                item.copy_done.record()
+        return batch[:, :-1], batch[:, 1:]
+
+    def stats(self) -> dict[str, float]:
+        """Time the consumer spent blocked on data, in seconds."""
+        return {
+            "num_batches": self.num_batches,
+            "wait_time": self.wait_time,
+            "wait_time_per_batch": self.wait_time / max(1, self.num_batches),
+        }
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._free.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
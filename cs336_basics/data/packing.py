@@ -0,0 +1,161 @@
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+import torch
+
+from cs336_basics.training.nn_utils import IGNORE_INDEX
+
+
+class PackedBatch(NamedTuple):
+    """
+    A batch of packed rows. `targets` is `IGNORE_INDEX` where the next token
+    belongs to another document (and on padding), `segment_ids` numbers the
+    documents of a row from 0 (-1 on padding) and `positions` restarts at 0
+    with every document. Pass `segment_ids` and `positions` to
+    `TransformerLM.loss` to keep attention within each document.
+    """
+
+    inputs: torch.Tensor
+    targets: torch.Tensor
+    segment_ids: torch.Tensor
+    positions: torch.Tensor
+
+
+def pack_documents(
+    doc_starts: npt.NDArray, doc_lengths: npt.NDArray, context_length: int
+) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """
+    Pack documents into rows of `context_length` tokens without cutting them,
+    except that a document longer than a row fills whole rows first and only
+    its remainder is packed.
+
+    Remainders are packed best-fit decreasing: longest first, each into the
+    row with the least free space that still fits it. Rows are bucketed by
+    free space and the non-empty buckets kept as bits of an int, so finding
+    that row is a shift and a lowest-set-bit instead of a scan.
+
+    Returns:
+        (row_splits, seg_starts, seg_lengths): row `i` is the segments
+        `row_splits[i]:row_splits[i + 1]`, each `seg_lengths` tokens from
+        token offset `seg_starts`
+    """
+    doc_starts = np.asarray(doc_starts, dtype=np.int64)
+    doc_lengths = np.asarray(doc_lengths, dtype=np.int64)
+
+    # Whole rows cut from long documents.
+    num_full = doc_lengths // context_length
+    first_full = np.cumsum(num_full) - num_full
+    full_index = np.arange(int(num_full.sum())) - np.repeat(first_full, num_full)
+    full_starts = np.repeat(doc_starts, num_full) + full_index * context_length
+
+    rem_lengths = doc_lengths % context_length
+    rem_starts = doc_starts + num_full * context_length
+    keep = rem_lengths > 0
+    rem_lengths, rem_starts = rem_lengths[keep], rem_starts[keep]
+
+    rows: list[list[int]] = []
+    buckets: list[list[int]] = [[] for _ in range(context_length + 1)]
+    nonempty = 0
+    for i in np.argsort(-rem_lengths, kind="stable").tolist():
+        length = int(rem_lengths[i])
+        fits = nonempty >> length
+        if fits:
+            free = length + (fits & -fits).bit_length() - 1
+            row = buckets[free].pop()
+            if not buckets[free]:
+                nonempty &= ~(1 << free)
+        else:
+            free, row = context_length, len(rows)
+            rows.append([])
+        rows[row].append(i)
+        free -= length
+        if free:
+            buckets[free].append(row)
+            nonempty |= 1 << free
+
+    order = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=len(rem_lengths))
+    row_sizes = np.concatenate(
+        (np.ones(len(full_starts), dtype=np.int64), [len(row) for row in rows])
+    ).astype(np.int64)
+    row_splits = np.concatenate(([0], np.cumsum(row_sizes)))
+    seg_starts = np.concatenate((full_starts, rem_starts[order]))
+    seg_lengths = np.concatenate(
+        (np.full(len(full_starts), context_length, dtype=np.int64), rem_lengths[order])
+    )
+    return row_splits, seg_starts, seg_lengths
+
+
+class PackedDataset:
+    """
+    Rows of whole documents packed from a token array and its document index
+    (e.g. a `TokenShard`), instead of windows that start and end mid-document.
+    Only the index is read to plan the packing; tokens are gathered per batch.
+    """
+
+    def __init__(
+        self,
+        tokens: npt.NDArray,
+        doc_starts: npt.NDArray,
+        context_length: int,
+        pad_id: int = 0,
+    ) -> None:
+        self.tokens = tokens
+        self.context_length = context_length
+        self.pad_id = pad_id
+        doc_starts = np.asarray(doc_starts, dtype=np.int64)
+        doc_lengths = np.diff(doc_starts, append=len(tokens))
+        self.num_docs = len(doc_starts)
+        self.row_splits, self.seg_starts, self.seg_lengths = pack_documents(
+            doc_starts, doc_lengths, context_length
+        )
+
+    def __len__(self) -> int:
+        return len(self.row_splits) - 1
+
+    def stats(self) -> dict:
+        """Packing efficiency: the share of row slots and of targets that are used."""
+        num_slots = len(self) * self.context_length
+        num_tokens = int(self.seg_lengths.sum())
+        # Every segment loses the target of its last token.
+        num_targets = num_tokens - len(self.seg_lengths)
+        return {
+            "num_docs": self.num_docs,
+            "num_rows": len(self),
+            "num_tokens": num_tokens,
+            "num_padding": num_slots - num_tokens,
+            "efficiency": num_tokens / max(1, num_slots),
+            "target_efficiency": num_targets / max(1, num_slots),
+        }
+
+    def get_rows(self, rows: npt.NDArray) -> tuple[npt.NDArray, ...]:
+        """NumPy (inputs, targets, segment_ids, positions) for the given rows."""
+        shape = (len(rows), self.context_length)
+        inputs = np.full(shape, self.pad_id, dtype=np.int64)
+        targets = np.full(shape, IGNORE_INDEX, dtype=np.int64)
+        segment_ids = np.full(shape, -1, dtype=np.int64)
+        positions = np.zeros(shape, dtype=np.int64)
+        for b, row in enumerate(rows):
+            offset = 0
+            for s in range(self.row_splits[row], self.row_splits[row + 1]):
+                start, length = self.seg_starts[s], self.seg_lengths[s]
+                end = offset + length
+                inputs[b, offset:end] = self.tokens[start : start + length]
+                targets[b, offset : end - 1] = inputs[b, offset + 1 : end]
+                segment_ids[b, offset:end] = s - self.row_splits[row]
+                positions[b, offset:end] = np.arange(length)
+                offset = end
+        return inputs, targets, segment_ids, positions
+
+    def get_batch(
+        self,
+        batch_size: int,
+        device: str | torch.device = "cpu",
+        generator: np.random.Generator | None = None,
+    ) -> PackedBatch:
+        if len(self) == 0:
+            raise ValueError("PackedDataset has no rows to sample from")
+        rng = generator if generator is not None else np.random.default_rng()
+        rows = rng.integers(0, len(self), size=batch_size)
+        return PackedBatch(*(torch.from_numpy(a).to(device) for a in self.get_rows(rows)))
+
@@ -0,0 +1,86 @@
+import numpy as np
+import numpy.typing as npt
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cs336_basics.data.dataset import windows_to_batch
+
+
+class EpochSampler:
+    """
+    Deterministic, resumable batch sampler over a (memmapped) token array.
+
+    Every epoch cuts the tokens into non-overlapping windows of
+    `context_length + 1` tokens (consecutive windows share one token, the last
+    target of one is the first input of the next) starting at a random offset
+    below `context_length`, and visits all of them once in a random order.
+    Offset and order only depend on `(seed, epoch)`, so the whole state is
+    `(seed, epoch, position)` and is saved with the checkpoint:
+
+        save_checkpoint(model, optimizer, it, out, sampler=sampler)
+        load_checkpoint(src, model, optimizer, sampler=sampler)
+    """
+
+    def __init__(
+        self,
+        tokens: npt.NDArray,
+        batch_size: int,
+        context_length: int,
+        seed: int = 0,
+    ) -> None:
+        if len(tokens) <= 2 * context_length:
+            raise ValueError(
+                f"Dataset of {len(tokens)} tokens is too short for context_length {context_length}"
+            )
+        self.tokens = tokens
+        self.batch_size = batch_size
+        self.context_length = context_length
+        self.seed = seed
+        self.epoch = 0
+        self.position = 0
+        self._windows = sliding_window_view(tokens, context_length + 1)
+        self._start_epoch()
+
+    def _start_epoch(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        offset = int(rng.integers(0, self.context_length))
+        num_windows = (len(self.tokens) - 1 - offset) // self.context_length
+        self._starts = offset + rng.permutation(num_windows) * self.context_length
+
+    def next_starts(self) -> npt.NDArray:
+        """Start offsets of the next batch, continuing into the next epoch if needed."""
+        parts = []
+        needed = self.batch_size
+        while needed:
+            part = self._starts[self.position : self.position + needed]
+            parts.append(part)
+            needed -= len(part)
+            self.position += len(part)
+            if self.position == len(self._starts):
+                self.epoch += 1
+                self.position = 0
+                self._start_epoch()
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def next_windows(self) -> npt.NDArray:
+        return self._windows[self.next_starts()]
+
+    def get_batch(
+        self, device: str | torch.device = "cpu"
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        return windows_to_batch(self.next_windows(), device)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.get_batch()
+
+    def state_dict(self) -> dict[str, int]:
+        return {"seed": self.seed, "epoch": self.epoch, "position": self.position}
+
+    def load_state_dict(self, state_dict: dict[str, int]):
+        self.seed = state_dict["seed"]
+        self.epoch = state_dict["epoch"]
+        self.position = state_dict["position"]
+        self._start_epoch()
@@ -0,0 +1,219 @@
+"""
+Self-describing token shard format.
+
+    [header, HEADER_SIZE bytes]
+        magic            8s   b"CS336TOK"
+        version          u32
+        itemsize         u32  1, 2 or 4 (unsigned token ids)
+        vocab_size       u64
+        num_tokens       u64
+        num_docs         u64  0 if no document index was written
+        tokenizer_hash   32s  sha256 of vocab, merges and special tokens
+    [tokens, num_tokens * itemsize bytes]
+    [padding to a multiple of 8 bytes]
+    [document start offsets, num_docs * u64]
+
+All integers are little-endian. The writer puts a header with
+`num_tokens == 0` in place when it opens the file and the real one when it
+is closed, so a shard whose header says `num_tokens == 0` but has data
+behind it was not finished; `TokenShard` refuses to read it.
+"""
+
+import hashlib
+import os
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+SHARD_MAGIC = b"CS336TOK"
+SHARD_VERSION = 1
+HEADER_SIZE = 256
+_HEADER_STRUCT = struct.Struct("<8sIIQQQ32s")
+_DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32}
+
+
+def smallest_token_dtype(vocab_size: int) -> np.dtype:
+    """The narrowest unsigned dtype that can hold every id in `range(vocab_size)`."""
+    for dtype in _DTYPES.values():
+        if vocab_size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    raise ValueError(f"vocab_size {vocab_size} does not fit in 32-bit token ids")
+
+
+def tokenizer_hash(tokenizer) -> bytes:
+    h = hashlib.sha256()
+    for token_id in sorted(tokenizer.vocab):
+        token = tokenizer.vocab[token_id]
+        h.update(struct.pack("<QI", token_id, len(token)) + token)
+    for a, b in tokenizer.merges:
+        h.update(struct.pack("<II", len(a), len(b)) + a + b)
+    for special_token in tokenizer.special_tokens:
+        token = special_token.encode("utf-8")
+        h.update(struct.pack("<I", len(token)) + token)
+    return h.digest()
+
+
+def is_shard(path: str | os.PathLike) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(SHARD_MAGIC)) == SHARD_MAGIC
+
+
+def _data_end(num_tokens: int, itemsize: int) -> int:
+    end = HEADER_SIZE + num_tokens * itemsize
+    return end + (-end % 8)
+
+
+class ShardWriter:
+    """
+    Stream token ids into a shard. When `doc_separator_id` is given, a
+    document starts at offset 0 and right after every occurrence of it.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        vocab_size: int,
+        tokenizer_hash: bytes = b"",
+        doc_separator_id: int | None = None,
+        dtype: npt.DTypeLike | None = None,
+        resume_tokens: int | None = None,
+    ) -> None:
+        """
+        With `resume_tokens`, an unfinished shard at `path` is truncated to
+        its first `resume_tokens` tokens and writing continues from there.
+        """
+        self.path = path
+        self.vocab_size = vocab_size
+        self.tokenizer_hash = tokenizer_hash
+        self.doc_separator_id = doc_separator_id
+        self.dtype = smallest_token_dtype(vocab_size) if dtype is None else np.dtype(dtype)
+        if vocab_size > np.iinfo(self.dtype).max + 1:
+            raise ValueError(f"{self.dtype} cannot hold ids of a {vocab_size} vocab")
+
+        self.num_tokens = 0
+        self._doc_starts: list[npt.NDArray] = []
+        self._next_is_doc_start = doc_separator_id is not None
+        if resume_tokens is None:
+            self._f = open(path, "wb")
+            self._write_header(0, 0)
+            return
+
+        data_end = HEADER_SIZE + resume_tokens * self.dtype.itemsize
+        if os.path.getsize(path) < data_end:
+            raise ValueError(f"{path} has fewer than {resume_tokens} tokens to resume from")
+        self._f = open(path, "r+b")
+        self._f.truncate(data_end)
+        # Mark the shard unfinished again until it is closed.
+        self._write_header(0, 0)
+        # The document index only lives in memory until `close`, so rebuild it
+        # from the tokens that are kept.
+        while self.num_tokens < resume_tokens:
+            count = min(1 << 24, resume_tokens - self.num_tokens)
+            ids = np.fromfile(self._f, dtype=self.dtype, count=count)
+            self._index_documents(ids)
+            self.num_tokens += ids.size
+
+    def _write_header(self, num_tokens: int, num_docs: int):
+        self._f.seek(0)
+        header = _HEADER_STRUCT.pack(
+            SHARD_MAGIC,
+            SHARD_VERSION,
+            self.dtype.itemsize,
+            self.vocab_size,
+            num_tokens,
+            num_docs,
+            self.tokenizer_hash,
+        )
+        self._f.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def sync(self):
+        """Make every token written so far durable."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _index_documents(self, ids: npt.NDArray):
+        if self.doc_separator_id is None:
+            return
+        starts = np.flatnonzero(ids == self.doc_separator_id) + 1
+        if self._next_is_doc_start:
+            starts = np.concatenate(([0], starts))
+        # A separator at the very end opens a document in the next write.
+        self._next_is_doc_start = bool(starts.size and starts[-1] == ids.size)
+        if self._next_is_doc_start:
+            starts = starts[:-1]
+        self._doc_starts.append(starts.astype(np.uint64) + self.num_tokens)
+
+    def write(self, token_ids: npt.ArrayLike):
+        ids = np.asarray(token_ids)
+        if ids.size == 0:
+            return
+        self._index_documents(ids)
+        ids.astype(self.dtype, copy=False).tofile(self._f)
+        self.num_tokens += ids.size
+
+    def close(self, finalize: bool = True):
+        """
+        Write the document index and header. With `finalize=False` the file is
+        only closed, leaving the shard unfinished (to be resumed or discarded).
+        """
+        if self._f.closed:
+            return
+        if not finalize:
+            self._f.close()
+            return
+        doc_starts = (
+            np.concatenate(self._doc_starts)
+            if self._doc_starts
+            else np.empty(0, dtype=np.uint64)
+        )
+        self._f.write(bytes(_data_end(self.num_tokens, self.dtype.itemsize) - self._f.tell()))
+        doc_starts.tofile(self._f)
+        self._write_header(self.num_tokens, len(doc_starts))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # A shard cut short by an exception must not look finished.
+        self.close(finalize=exc[0] is None)
+
+
+class TokenShard:
+    """Read-only view of a shard; tokens and document starts are memory-mapped."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_STRUCT.size)
+        if len(header) < _HEADER_STRUCT.size or not header.startswith(SHARD_MAGIC):
+            raise ValueError(f"{path} is not a token shard")
+        (
+            _,
+            version,
+            itemsize,
+            self.vocab_size,
+            self.num_tokens,
+            self.num_docs,
+            self.tokenizer_hash,
+        ) = _HEADER_STRUCT.unpack(header)
+        if version != SHARD_VERSION:
+            raise ValueError(f"{path}: unsupported shard version {version}")
+        if self.num_tokens == 0 and os.path.getsize(path) > HEADER_SIZE:
+            raise ValueError(f"{path} is an unfinished shard (its writer was not closed)")
+
+        self.dtype = np.dtype(_DTYPES[itemsize])
+        self.tokens = self._memmap(self.dtype, HEADER_SIZE, self.num_tokens)
+        self.doc_starts = self._memmap(
+            np.uint64, _data_end(self.num_tokens, itemsize), self.num_docs
+        )
+
+    def _memmap(self, dtype, offset: int, count: int) -> npt.NDArray:
+        # np.memmap refuses zero-length maps
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+    def __len__(self) -> int:
+        return self.num_tokens
@@ -0,0 +1,207 @@
+"""
+Token statistics of encoded datasets, computed in one streaming pass.
+
+    python -m cs336_basics.data.stats datasets/tiny_stories/train.bin \
+        --tokenizer-dir datasets/tiny_stories --json train_stats.json --csv train_freqs.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import numpy.typing as npt
+
+from cs336_basics.data.shard import TokenShard, is_shard
+from cs336_basics.tokenizer.utils import print_color
+
+DEFAULT_WINDOW = 1 << 24
+
+
+def _open_tokens(path: str | os.PathLike, dtype: npt.DTypeLike) -> npt.NDArray:
+    if is_shard(path):
+        return TokenShard(path).tokens
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def _count_range(task: tuple) -> npt.NDArray:
+    path, dtype, start, end, minlength, window = task
+    tokens = _open_tokens(path, dtype)
+    counts = np.zeros(minlength, dtype=np.int64)
+    for i in range(start, end, window):
+        partial = np.bincount(tokens[i : min(i + window, end)], minlength=minlength)
+        if len(partial) > len(counts):
+            partial[: len(counts)] += counts
+            counts = partial
+        else:
+            counts += partial
+    return counts
+
+
+def token_counts(
+    path: str | os.PathLike,
+    dtype: npt.DTypeLike = np.uint16,
+    vocab_size: int | None = None,
+    window: int = DEFAULT_WINDOW,
+    num_workers: int = 1,
+) -> npt.NDArray:
+    """
+    Histogram of token ids, reading the memmapped file `window` tokens at a
+    time so memory stays bounded. With `num_workers > 1`, contiguous ranges of
+    the file are counted in separate processes.
+    """
+    tokens = _open_tokens(path, dtype)
+    minlength = vocab_size or 0
+    bounds = np.linspace(0, len(tokens), max(1, num_workers) + 1).astype(np.int64)
+    tasks = [
+        (path, dtype, int(start), int(end), minlength, window)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    if len(tasks) == 1:
+        partials = [_count_range(tasks[0])]
+    else:
+        with Pool(len(tasks)) as pool:
+            partials = pool.map(_count_range, tasks)
+
+    counts = np.zeros(max(len(p) for p in partials), dtype=np.int64)
+    for partial in partials:
+        counts[: len(partial)] += partial
+    return counts
+
+
+def _distribution(values: npt.NDArray) -> dict:
+    if len(values) == 0:
+        return {"count": 0}
+    percentiles = [1, 10, 25, 50, 75, 90, 99]
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "min": int(values.min()),
+        "max": int(values.max()),
+        "percentiles": {
+            str(p): float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))
+        },
+    }
+
+
+def dataset_stats(
+    path: str | os.PathLike,
+    vocab: dict[int, bytes] | None = None,
+    dtype: npt.DTypeLike = np.uint16,
+    window: int = DEFAULT_WINDOW,
+    num_workers: int = 1,
+    top_k: int = 50,
+    special_tokens: list[str] | None = None,
+) -> tuple[dict, npt.NDArray]:
+    """
+    Summarize an encoded dataset (a token shard or a headerless `.bin` of
+    `dtype`). With the tokenizer `vocab`, the report also has the number of
+    text bytes the tokens decode to and thus bytes per token. Tokens of
+    `special_tokens` (e.g. `<|endoftext|>`) are not text: they are left out
+    of both and counted in `num_special_tokens` instead.
+
+    Returns:
+        (report, counts): a JSON-serializable report and the token histogram
+    """
+    shard = TokenShard(path) if is_shard(path) else None
+    vocab_size = shard.vocab_size if shard else (max(vocab) + 1 if vocab else None)
+    counts = token_counts(path, dtype, vocab_size, window, num_workers)
+    num_tokens = int(counts.sum())
+
+    top_ids = np.argsort(-counts, kind="stable")[:top_k]
+    report = {
+        "path": os.fspath(path),
+        "num_tokens": num_tokens,
+        "vocab_size": int(vocab_size or len(counts)),
+        "num_used_ids": int(np.count_nonzero(counts)),
+        "unused_ids": np.flatnonzero(counts == 0).tolist(),
+        "top_tokens": [
+            {
+                "id": int(i),
+                "count": int(counts[i]),
+                "fraction": float(counts[i] / max(1, num_tokens)),
+                **({"token": vocab[int(i)].decode("utf-8", errors="replace")} if vocab else {}),
+            }
+            for i in top_ids
+            if counts[i] > 0
+        ],
+    }
+
+    if vocab:
+        special = {token.encode("utf-8") for token in special_tokens or []}
+        token_lengths = np.zeros(len(counts), dtype=np.int64)
+        is_special = np.zeros(len(counts), dtype=bool)
+        for i, token in vocab.items():
+            if i < len(token_lengths):
+                token_lengths[i] = len(token)
+                is_special[i] = token in special
+        num_special = int(counts[is_special].sum())
+        num_bytes = int(counts[~is_special] @ token_lengths[~is_special])
+        report["num_special_tokens"] = num_special
+        report["num_bytes"] = num_bytes
+        report["bytes_per_token"] = num_bytes / max(1, num_tokens - num_special)
+
+    if shard is not None and shard.num_docs:
+        doc_starts = np.asarray(shard.doc_starts, dtype=np.int64)
+        doc_lengths = np.diff(doc_starts, append=shard.num_tokens)
+        report["document_lengths"] = _distribution(doc_lengths)
+
+    return report, counts
+
+
+def write_counts_csv(
+    path: str | os.PathLike, counts: npt.NDArray, vocab: dict[int, bytes] | None = None
+):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "count", "token"] if vocab else ["id", "count"])
+        for i, count in enumerate(counts.tolist()):
+            row = [i, count]
+            if vocab:
+                row.append(vocab.get(i, b"").decode("utf-8", errors="replace"))
+            writer.writerow(row)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path", help="token shard or headerless .bin file")
+    parser.add_argument("--tokenizer-dir", default=None)
+    parser.add_argument("--dtype", default="uint16", help="dtype of headerless .bin files")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--num-workers", type=int, default=1)
+    parser.add_argument("--json", default=None, help="where to write the report")
+    parser.add_argument("--csv", default=None, help="where to write per-id counts")
+    args = parser.parse_args(argv)
+
+    vocab = special_tokens = None
+    if args.tokenizer_dir:
+        # Imported here so that stats on a plain .bin do not need the tokenizer files.
+        from cs336_basics.tokenizer.tokenizer import load_tokenizer_from_dir
+
+        tokenizer = load_tokenizer_from_dir(args.tokenizer_dir)
+        vocab, special_tokens = tokenizer.vocab, tokenizer.special_tokens
+
+    report, counts = dataset_stats(
+        args.path,
+        vocab,
+        np.dtype(args.dtype),
+        args.window,
+        args.num_workers,
+        special_tokens=special_tokens,
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.csv:
+        write_counts_csv(args.csv, counts, vocab)
+
+    print_color(
+        f"{report['num_tokens']} tokens, {report['num_used_ids']}/{report['vocab_size']} ids used"
+        + (f", {report['bytes_per_token']:.3f} bytes/token" if vocab else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import math
+from collections import OrderedDict
+
+import torch
+from jaxtyping import Bool, Float, Int
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+from cs336_basics.model.layers import Linear, softmax
+
+
+def scaled_dot_product_attention(
+    Q: Float[Tensor, "... queries d_k"],
+    K: Float[Tensor, "... keys d_k"],
+    V: Float[Tensor, "... keys d_v"],
+    mask: Bool[Tensor, "... queries keys"] | None = None,
+) -> Float[Tensor, "... queries d_v"]:
+    """Attention where `mask` is True for the keys each query may attend to."""
+    scores = Q @ K.transpose(-2, -1) / math.sqrt(Q.shape[-1])
+    if mask is not None:
+        scores = scores.masked_fill(~mask, float("-inf"))
+    return softmax(scores, dim=-1) @ V
+
+
+def segment_attention_mask(segment_ids: Int[Tensor, "... seq"]) -> Bool[Tensor, "... seq seq"]:
+    """Causal mask that also keeps attention within a segment (e.g. a packed document)."""
+    same = segment_ids[..., :, None] == segment_ids[..., None, :]
+    seq_len = segment_ids.shape[-1]
+    causal = torch.ones(seq_len, seq_len, dtype=torch.bool, device=segment_ids.device).tril()
+    return same & causal
+
+
+def tiled_causal_attention(
+    Q: Float[Tensor, "... queries d_k"],
+    K: Float[Tensor, "... keys d_k"],
+    V: Float[Tensor, "... keys d_v"],
+    key_mask: Bool[Tensor, "... keys"] | None = None,
+    block_size: int = 128,
+    segment_ids: Int[Tensor, "... keys"] | None = None,
+) -> Float[Tensor, "... queries d_v"]:
+    """
+    Causal attention computed over `block_size` x `block_size` tiles with an
+    online softmax, so no (queries, keys) score matrix is materialized.
+
+    Queries are the last `queries` positions of the keys (as with a KV cache).
+    Key tiles entirely after a query tile are skipped and only tiles crossing
+    the diagonal are masked. `key_mask` is False for keys nobody may attend
+    to; a query with no visible key gets zeros. With `segment_ids`, queries
+    only see keys of their own segment. Scores and the running max/sum are
+    kept in float32.
+    """
+    num_queries, num_keys = Q.shape[-2], K.shape[-2]
+    offset = num_keys - num_queries
+    scale = 1 / math.sqrt(Q.shape[-1])
+    out = Q.new_empty(*Q.shape[:-1], V.shape[-1])
+    key_idx = torch.arange(num_keys, device=Q.device)
+    for q_start in range(0, num_queries, block_size):
+        q_end = min(q_start + block_size, num_queries)
+        q = Q[..., q_start:q_end, :].float() * scale
+        query_idx = torch.arange(offset + q_start, offset + q_end, device=Q.device)[:, None]
+        row_max = q.new_full((*q.shape[:-1], 1), float("-inf"))
+        row_sum = q.new_zeros((*q.shape[:-1], 1))
+        acc = q.new_zeros((*q.shape[:-1], V.shape[-1]))
+        # Keys after the last query of the tile are masked for every query in it.
+        for k_start in range(0, offset + q_end, block_size):
+            k_end = min(k_start + block_size, offset + q_end)
+            scores = q @ K[..., k_start:k_end, :].float().transpose(-2, -1)
+            mask = None
+            if k_end - 1 > offset + q_start:
+                mask = key_idx[k_start:k_end] <= query_idx
+            if key_mask is not None:
+                tile_mask = key_mask[..., None, k_start:k_end]
+                mask = tile_mask if mask is None else mask & tile_mask
+            if segment_ids is not None:
+                query_segments = segment_ids[..., offset + q_start : offset + q_end, None]
+                tile_mask = query_segments == segment_ids[..., None, k_start:k_end]
+                mask = tile_mask if mask is None else mask & tile_mask
+            if mask is not None:
+                scores = scores.masked_fill(~mask, float("-inf"))
+
+            new_max = torch.maximum(row_max, scores.amax(dim=-1, keepdim=True))
+            # Rows that have seen no visible key yet keep a max of -inf; shift them by 0.
+            safe_max = new_max.masked_fill(new_max == float("-inf"), 0)
+            probs = torch.exp(scores - safe_max)
+            correction = torch.exp(row_max - safe_max)
+            row_sum = row_sum * correction + probs.sum(dim=-1, keepdim=True)
+            acc = acc * correction + probs @ V[..., k_start:k_end, :].float()
+            row_max = new_max
+        out[..., q_start:q_end, :] = (acc / row_sum.clamp(min=1e-30)).to(out.dtype)
+    return out
+
+
+ATTENTION_BACKENDS = ("reference", "torch", "tiled")
+
+
+def causal_attention(
+    q: Tensor,
+    k: Tensor,
+    v: Tensor,
+    backend: str = "reference",
+    kv_cache: "KVCache | None" = None,
+    segment_ids: Tensor | None = None,
+) -> Tensor:
+    """
+    Causal attention of `q` over `k`/`v` with the given backend: our own
+    `scaled_dot_product_attention` on a full mask, PyTorch's fused
+    `F.scaled_dot_product_attention`, or `tiled_causal_attention`. With a KV
+    cache, `k`/`v` are the cached keys/values and its padding is masked.
+    With `segment_ids` (batch, seq), e.g. of packed documents, attention
+    stays within each segment; they cannot be combined with a cache.
+    """
+    num_queries, num_keys = q.shape[-2], k.shape[-2]
+    if segment_ids is not None and kv_cache is not None:
+        raise ValueError("segment_ids cannot be used with a KV cache")
+    if backend == "tiled":
+        key_mask = kv_cache.key_mask[:, None, :num_keys] if kv_cache is not None else None
+        segments = segment_ids.unsqueeze(-2) if segment_ids is not None else None
+        return tiled_causal_attention(q, k, v, key_mask, segment_ids=segments)
+    if kv_cache is not None:
+        mask = kv_cache.attention_mask(num_queries)
+    elif segment_ids is not None:
+        # Broadcast over the head dimension.
+        mask = segment_attention_mask(segment_ids).unsqueeze(-3)
+    elif backend == "torch":
+        return F.scaled_dot_product_attention(q, k, v, is_causal=True)
+    else:
+        mask = torch.ones(num_queries, num_keys, dtype=torch.bool, device=q.device).tril()
+    if backend == "torch":
+        return F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+    if backend == "reference":
+        return scaled_dot_product_attention(q, k, v, mask)
+    raise ValueError(f"Unknown attention backend {backend!r}, expected one of {ATTENTION_BACKENDS}")
+
+
+# (d_k, theta, device, dtype) -> (cos, sin), each (num_positions, d_k // 2),
+# least recently used first.
+_ROPE_TABLES: OrderedDict[tuple, tuple[Tensor, Tensor]] = OrderedDict()
+_ROPE_TABLES_MAX_ENTRIES = 8
+
+
+def _resolve_device(device) -> torch.device:
+    # "cuda" and "cuda:0" must share tables, so resolve the default index.
+    device = torch.device(device or "cpu")
+    if device.type == "cuda" and device.index is None:
+        device = torch.device("cuda", torch.cuda.current_device())
+    return device
+
+
+def rope_tables(
+    d_k: int, theta: float, num_positions: int, device=None, dtype=torch.float32
+) -> tuple[Tensor, Tensor]:
+    """
+    cos/sin tables for at least `num_positions` positions, shared by every RoPE
+    module with the same `(d_k, theta)`. A longer request regrows the tables
+    to the next power of two, so they are rebuilt O(log n) times in total.
+    Only the `_ROPE_TABLES_MAX_ENTRIES` most recently used tables are kept.
+    """
+    key = (d_k, float(theta), _resolve_device(device), dtype)
+    tables = _ROPE_TABLES.get(key)
+    if tables is None or len(tables[0]) < num_positions:
+        length = 1 << max(0, num_positions - 1).bit_length()
+        inv_freq = theta ** (-torch.arange(0, d_k, 2, device=key[2], dtype=torch.float32) / d_k)
+        angles = torch.outer(torch.arange(length, device=key[2], dtype=torch.float32), inv_freq)
+        tables = _ROPE_TABLES[key] = (angles.cos().to(dtype), angles.sin().to(dtype))
+        while len(_ROPE_TABLES) > _ROPE_TABLES_MAX_ENTRIES:
+            _ROPE_TABLES.popitem(last=False)
+    _ROPE_TABLES.move_to_end(key)
+    return tables
+
+
+def apply_rotary(x: Tensor, cos: Tensor, sin: Tensor, inplace: bool = False) -> Tensor:
+    """
+    Rotate the interleaved pairs `(x[2i], x[2i + 1])` by the given angles.
+
+    Both halves are strided views of `x`. With `inplace` they are rotated in
+    place, needing one temporary copy of the even half; otherwise (e.g. when
+    autograd needs `x`) the result is written into the views of a new tensor.
+    """
+    x1, x2 = x[..., 0::2], x[..., 1::2]
+    if inplace:
+        x1_copy = x1.clone()
+        x1.mul_(cos).addcmul_(x2, sin, value=-1)
+        x2.mul_(cos).addcmul_(x1_copy, sin)
+        return x
+    out = torch.empty_like(x)
+    out[..., 0::2] = x1 * cos - x2 * sin
+    out[..., 1::2] = x1 * sin + x2 * cos
+    return out
+
+
+class RotaryPositionalEmbedding(nn.Module):
+    """
+    RoPE over interleaved pairs `(x[2i], x[2i + 1])` of the last dimension.
+
+    The cos/sin tables come from `rope_tables`, so they are computed once per
+    `(d_k, theta)` (and device/dtype) for all layers and models, and grow when
+    a position past `max_seq_len` is requested. Without `token_positions` the
+    positions are `start, start + 1, ...` and the tables are sliced instead
+    of gathered.
+    """
+
+    def __init__(self, theta: float, d_k: int, max_seq_len: int, device=None) -> None:
+        super().__init__()
+        self.theta = theta
+        self.d_k = d_k
+        self.max_seq_len = max_seq_len
+        rope_tables(d_k, theta, max_seq_len, device)
+
+    def forward(
+        self,
+        x: Float[Tensor, "... seq d_k"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        start: int = 0,
+        inplace: bool = False,
+        num_positions: int | None = None,
+    ) -> Float[Tensor, "... seq d_k"]:
+        """
+        Explicit `token_positions` must be below `num_positions`. Callers that
+        know a bound (e.g. the KV cache size) pass it to avoid a device sync;
+        otherwise it is read from the positions. The tables are cut to the
+        bound, so a position past it fails whatever tables are cached.
+        """
+        seq_len = x.shape[-2]
+        if token_positions is None:
+            cos, sin = rope_tables(self.d_k, self.theta, start + seq_len, x.device, x.dtype)
+            cos, sin = cos[start : start + seq_len], sin[start : start + seq_len]
+        else:
+            if num_positions is None:
+                num_positions = (
+                    int(token_positions.max()) + 1 if token_positions.numel() else 0
+                )
+            cos, sin = rope_tables(self.d_k, self.theta, num_positions, x.device, x.dtype)
+            cos, sin = cos[:num_positions][token_positions], sin[:num_positions][token_positions]
+        return apply_rotary(x, cos, sin, inplace)
+
+
+class KVCache:
+    """
+    Preallocated keys and values of every layer for incremental decoding.
+
+    A forward pass with the cache only computes projections for the new
+    tokens, writes their keys and values at `length` and attends over the
+    first `length + num_new` slots. `TransformerLM` advances `length` once
+    after all layers. `key_mask` marks slots that are padding (e.g. left
+    padding of shorter prompts) and must not be attended to.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        batch_size: int,
+        num_heads: int,
+        max_seq_len: int,
+        d_k: int,
+        device=None,
+        dtype=None,
+    ) -> None:
+        shape = (num_layers, batch_size, num_heads, max_seq_len, d_k)
+        self.keys = torch.zeros(shape, device=device, dtype=dtype)
+        self.values = torch.zeros(shape, device=device, dtype=dtype)
+        self.key_mask = torch.ones(batch_size, max_seq_len, dtype=torch.bool, device=device)
+        self.max_seq_len = max_seq_len
+        self.length = 0
+        self._mask: tuple[tuple, Tensor] | None = None
+
+    def update(self, layer_idx: int, k: Tensor, v: Tensor) -> tuple[Tensor, Tensor]:
+        """Store the new keys/values (batch, heads, new, d_k) and return all so far."""
+        end = self.length + k.shape[-2]
+        if end > self.max_seq_len:
+            raise ValueError(f"KV cache of {self.max_seq_len} positions is full")
+        self.keys[layer_idx, :, :, self.length : end] = k
+        self.values[layer_idx, :, :, self.length : end] = v
+        return self.keys[layer_idx, :, :, :end], self.values[layer_idx, :, :, :end]
+
+    def attention_mask(self, num_new: int) -> Bool[Tensor, "batch 1 new total"]:
+        """Causal mask of the new queries over the cache, shared by all layers."""
+        # Any write to `key_mask` (in place or by assignment) bumps its version
+        # or replaces it, so an edited mask is never served from the memo.
+        key = (self.length, num_new, id(self.key_mask), self.key_mask._version)
+        if self._mask is not None and self._mask[0] == key:
+            return self._mask[1]
+        end = self.length + num_new
+        device = self.key_mask.device
+        query_idx = torch.arange(self.length, end, device=device)[:, None]
+        key_idx = torch.arange(end, device=device)[None, :]
+        # A padding query still attends to itself, so its row is never all -inf.
+        mask = (key_idx <= query_idx) & (self.key_mask[:, None, :end] | (key_idx == query_idx))
+        mask = mask.unsqueeze(1)
+        self._mask = (key, mask)
+        return mask
+
+    def advance(self, num_tokens: int):
+        self.length += num_tokens
+
+    def reset(self):
+        self.length = 0
+        self.key_mask.fill_(True)
+        self._mask = None
+
+
+class MultiHeadSelfAttention(nn.Module):
+    """
+    Causal multi-head self-attention, with RoPE on queries and keys if given.
+
+    Queries, keys and values of all heads come from one packed
+    `[3 * d_model, d_model]` projection, i.e. one GEMM, and are split into
+    heads with views. State dicts in the reference layout (separate
+    `q_proj`/`k_proj`/`v_proj` weights) are packed on load.
+    """
+
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        rope: RotaryPositionalEmbedding | None = None,
+        layer_idx: int = 0,
+        attn_backend: str = "reference",
+        device=None,
+        dtype=None,
+    ) -> None:
+        super().__init__()
+        if d_model % num_heads:
+            raise ValueError(f"d_model {d_model} is not divisible by num_heads {num_heads}")
+        if attn_backend not in ATTENTION_BACKENDS:
+            raise ValueError(f"Unknown attention backend {attn_backend!r}, expected one of {ATTENTION_BACKENDS}")
+        self.attn_backend = attn_backend
+        self.d_model = d_model
+        self.num_heads = num_heads
+        self.d_k = d_model // num_heads
+        self.rope = rope
+        # Which layer of a `KVCache` this module reads and writes.
+        self.layer_idx = layer_idx
+        self.qkv_proj = Linear(d_model, 3 * d_model, device=device, dtype=dtype)
+        # Initialize like three separate (d_model, d_model) projections.
+        std = math.sqrt(2 / (2 * d_model))
+        nn.init.trunc_normal_(self.qkv_proj.weight, std=std, a=-3 * std, b=3 * std)
+        self.output_proj = Linear(d_model, d_model, device=device, dtype=dtype)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        names = [f"{prefix}{name}_proj.weight" for name in "qkv"]
+        if all(name in state_dict for name in names):
+            state_dict[f"{prefix}qkv_proj.weight"] = torch.cat([state_dict.pop(name) for name in names])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _project_qkv(self, x: Tensor) -> tuple[Tensor, Tensor, Tensor]:
+        # (..., seq, 3 * d_model) -> 3 x (..., heads, seq, d_k), all views of one GEMM output.
+        qkv = self.qkv_proj(x).unflatten(-1, (3, self.num_heads, self.d_k))
+        qkv = qkv.movedim(-3, 0).transpose(-3, -2)
+        return qkv[0], qkv[1], qkv[2]
+
+    def forward(
+        self,
+        x: Float[Tensor, "... seq d_model"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        kv_cache: KVCache | None = None,
+        segment_ids: Int[Tensor, "... seq"] | None = None,
+    ) -> Float[Tensor, "... seq d_model"]:
+        """
+        With `segment_ids`, tokens only attend to earlier tokens of the same
+        segment, e.g. of their own document in a packed row.
+        """
+        q, k, v = self._project_qkv(x)
+        if self.rope is not None:
+            start = kv_cache.length if kv_cache is not None else 0
+            # Positions in a cache never exceed its length.
+            num_positions = kv_cache.max_seq_len if kv_cache is not None else None
+            # Broadcast the positions over the head dimension.
+            positions = token_positions.unsqueeze(-2) if token_positions is not None else None
+            # q and k are views of this layer's own projection output, so they can be rotated
+            # in place unless autograd needs them.
+            inplace = not (torch.is_grad_enabled() and q.requires_grad)
+            q = self.rope(q, positions, start, inplace, num_positions)
+            k = self.rope(k, positions, start, inplace, num_positions)
+
+        if kv_cache is not None:
+            k, v = kv_cache.update(self.layer_idx, k, v)
+        out = causal_attention(q, k, v, self.attn_backend, kv_cache, segment_ids)
+        return self.output_proj(out.transpose(-3, -2).flatten(-2))
@@ -0,0 +1,202 @@
+"""
+Micro-benchmarks of model components, on CPU unless a device is given.
+
+    python -m cs336_basics.model.benchmark qkv --batch-size 8 --seq-len 256 --d-model 512
+    python -m cs336_basics.model.benchmark attention --seq-lens 256 1024 2048
+    python -m cs336_basics.model.benchmark checkpointing --every 0 1 2
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+import torch
+from torch import nn
+
+from cs336_basics.model.attention import (
+    ATTENTION_BACKENDS,
+    MultiHeadSelfAttention,
+    causal_attention,
+    scaled_dot_product_attention,
+)
+from cs336_basics.model.transformer import TransformerLM
+from cs336_basics.tokenizer.utils import print_color
+
+
+def time_fn(fn: Callable[[], object], warmup: int = 3, repeats: int = 10) -> float:
+    """Median wall time of `fn()` in seconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def naive_attention(
+    attn: MultiHeadSelfAttention, q_w: torch.Tensor, k_w: torch.Tensor, v_w: torch.Tensor, x: torch.Tensor
+) -> torch.Tensor:
+    """The same attention with three separate projections and copied head reshapes."""
+    seq_len = x.shape[-2]
+
+    def split(y):
+        return y.reshape(*y.shape[:-1], attn.num_heads, attn.d_k).transpose(-3, -2).contiguous()
+
+    q, k, v = split(x @ q_w.T), split(x @ k_w.T), split(x @ v_w.T)
+    causal = torch.ones(seq_len, seq_len, dtype=torch.bool).tril()
+    out = scaled_dot_product_attention(q, k, v, causal).transpose(-3, -2).contiguous()
+    return attn.output_proj(out.reshape(*x.shape))
+
+
+@torch.no_grad()
+def benchmark_qkv(batch_size: int, seq_len: int, d_model: int, num_heads: int) -> dict:
+    attn = MultiHeadSelfAttention(d_model, num_heads)
+    q_w, k_w, v_w = (w.contiguous() for w in attn.qkv_proj.weight.chunk(3))
+    x = torch.randn(batch_size, seq_len, d_model)
+    if not torch.allclose(attn(x), naive_attention(attn, q_w, k_w, v_w, x), atol=1e-5):
+        raise AssertionError("packed and naive attention disagree")
+
+    packed_proj = time_fn(lambda: attn.qkv_proj(x))
+    naive_proj = time_fn(lambda: (x @ q_w.T, x @ k_w.T, x @ v_w.T))
+    packed = time_fn(lambda: attn(x))
+    naive = time_fn(lambda: naive_attention(attn, q_w, k_w, v_w, x))
+    return {
+        "projection_packed_ms": packed_proj * 1e3,
+        "projection_naive_ms": naive_proj * 1e3,
+        "attention_packed_ms": packed * 1e3,
+        "attention_naive_ms": naive * 1e3,
+        "speedup": naive / packed,
+    }
+
+
+@torch.no_grad()
+def benchmark_attention(
+    batch_size: int, num_heads: int, seq_len: int, d_k: int, device: str = "cpu"
+) -> dict:
+    """
+    Latency of every attention backend, and its peak memory on CUDA. On CPU,
+    `scores_mb` is the size of the largest score buffer instead: the full
+    (seq_len, seq_len) matrix for the reference, one tile for "tiled".
+    """
+    q, k, v = (torch.randn(batch_size, num_heads, seq_len, d_k, device=device) for _ in range(3))
+    reference = causal_attention(q, k, v, "reference")
+    result = {}
+    for backend in ATTENTION_BACKENDS:
+        out = causal_attention(q, k, v, backend)
+        if not torch.allclose(out, reference, atol=1e-4):
+            raise AssertionError(f"{backend} attention disagrees with the reference")
+        del out
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            base = torch.cuda.memory_allocated()
+            causal_attention(q, k, v, backend)
+            torch.cuda.synchronize()
+            result[f"{backend}_peak_mb"] = (torch.cuda.max_memory_allocated() - base) / 2**20
+
+        def run():
+            causal_attention(q, k, v, backend)
+            if device.startswith("cuda"):
+                torch.cuda.synchronize()
+
+        result[f"{backend}_ms"] = time_fn(run, warmup=1, repeats=3) * 1e3
+    block = min(128, seq_len)
+    result["reference_scores_mb"] = batch_size * num_heads * seq_len**2 * 4 / 2**20
+    result["tiled_scores_mb"] = batch_size * num_heads * block**2 * 4 / 2**20
+    return result
+
+
+def saved_activation_bytes(fn: Callable[[], torch.Tensor]) -> tuple[torch.Tensor, int]:
+    """Run `fn` and count the bytes of tensors autograd saves for backward (parameters excluded)."""
+    seen: set[int] = set()
+    total = 0
+
+    def pack(tensor):
+        nonlocal total
+        if not isinstance(tensor, nn.Parameter) and tensor.untyped_storage().data_ptr() not in seen:
+            seen.add(tensor.untyped_storage().data_ptr())
+            total += tensor.untyped_storage().nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        out = fn()
+    return out, total
+
+
+def benchmark_checkpointing(
+    every: list[int], batch_size: int, seq_len: int, d_model: int, num_layers: int, device: str = "cpu"
+) -> dict:
+    """
+    Activation memory kept for backward and forward+backward time of one
+    training step, per `checkpoint_every` setting (0: off).
+    """
+    torch.manual_seed(0)
+    model = TransformerLM(10000, seq_len, d_model, num_layers, d_model // 64, 4 * d_model, device=device)
+    ids = torch.randint(0, 10000, (batch_size, seq_len), device=device)
+    result = {}
+    for k in every:
+        model.checkpoint_every = k
+
+        def step():
+            loss, saved = saved_activation_bytes(lambda: model.loss(ids[:, :-1], ids[:, 1:]))
+            loss.backward()
+            model.zero_grad(set_to_none=True)
+            if device.startswith("cuda"):
+                torch.cuda.synchronize()
+            return saved
+
+        result[f"every={k}_saved_mb"] = step() / 2**20
+        result[f"every={k}_step_ms"] = time_fn(step, warmup=1, repeats=3) * 1e3
+    return result
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    qkv = subparsers.add_parser("qkv", help="packed vs. separate QKV projections")
+    qkv.add_argument("--batch-size", type=int, default=8)
+    qkv.add_argument("--seq-len", type=int, default=256)
+    qkv.add_argument("--d-model", type=int, default=512)
+    qkv.add_argument("--num-heads", type=int, default=16)
+
+    attention = subparsers.add_parser("attention", help="attention backends by sequence length")
+    attention.add_argument("--batch-size", type=int, default=4)
+    attention.add_argument("--num-heads", type=int, default=8)
+    attention.add_argument("--seq-lens", type=int, nargs="+", default=[256, 1024])
+    attention.add_argument("--d-k", type=int, default=64)
+    attention.add_argument("--device", default="cpu")
+
+    checkpointing = subparsers.add_parser("checkpointing", help="activation checkpointing settings")
+    checkpointing.add_argument("--every", type=int, nargs="+", default=[0, 1, 2])
+    checkpointing.add_argument("--batch-size", type=int, default=4)
+    checkpointing.add_argument("--seq-len", type=int, default=256)
+    checkpointing.add_argument("--d-model", type=int, default=256)
+    checkpointing.add_argument("--num-layers", type=int, default=4)
+    checkpointing.add_argument("--device", default="cpu")
+
+    args = parser.parse_args(argv)
+    if args.command == "qkv":
+        results = {"": benchmark_qkv(args.batch_size, args.seq_len, args.d_model, args.num_heads)}
+    elif args.command == "attention":
+        results = {
+            f"seq_len={seq_len} ": benchmark_attention(
+                args.batch_size, args.num_heads, seq_len, args.d_k, args.device
+            )
+            for seq_len in args.seq_lens
+        }
+    elif args.command == "checkpointing":
+        results = {
+            "": benchmark_checkpointing(
+                args.every, args.batch_size, args.seq_len, args.d_model, args.num_layers, args.device
+            )
+        }
+    for prefix, result in results.items():
+        for name, value in result.items():
+            print_color(f"{prefix}{name}: {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import time
+from collections.abc import Iterator
+
+import torch
+from torch import Tensor
+
+from cs336_basics.model.transformer import TransformerLM
+from cs336_basics.tokenizer.tokenizer import Tokenizer
+
+
+def sample_next_token(
+    logits: Tensor,
+    temperature: float = 1.0,
+    top_k: int | None = None,
+    top_p: float | None = None,
+    generator: torch.Generator | None = None,
+) -> Tensor:
+    """
+    Sample one id per row of `logits` (batch, vocab_size). `temperature == 0`
+    is greedy; `top_k` keeps the k most likely ids and `top_p` the smallest
+    set of ids whose probabilities add up to at least `top_p`.
+    """
+    if top_p is not None and not 0 < top_p <= 1:
+        raise ValueError(f"top_p must be in (0, 1], got {top_p}")
+    if temperature == 0:
+        return logits.argmax(dim=-1)
+    logits = logits.float() / temperature
+    if top_k is not None and top_k < logits.shape[-1]:
+        kth = logits.topk(top_k, dim=-1).values[..., -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if top_p is not None and top_p < 1.0:
+        sorted_logits, sorted_ids = logits.sort(dim=-1, descending=True)
+        sorted_probs = sorted_logits.softmax(dim=-1)
+        # Drop an id if the ids before it already reach top_p; the first is always kept.
+        drop = sorted_probs.cumsum(dim=-1) - sorted_probs >= top_p
+        logits = logits.scatter(-1, sorted_ids, sorted_logits.masked_fill(drop, float("-inf")))
+    probs = logits.softmax(dim=-1)
+    return torch.multinomial(probs, 1, generator=generator).squeeze(-1)
+
+
+class GenerationEngine:
+    """
+    Batched sampling from a `TransformerLM` with a KV cache.
+
+    Prompts of different lengths are left-padded into one prefill pass
+    (padding is masked out of the cache and positions start at each prompt's
+    first token); then one token per row is decoded per step until every row
+    produced `stop_token` or `max_new_tokens`. `stream` yields decoded text
+    as it is produced, `generate` returns whole completions. `stats()` has
+    prefill and decode throughput of the last run, measured separately.
+    Empty prompts start from `stop_token`.
+    """
+
+    def __init__(
+        self,
+        model: TransformerLM,
+        tokenizer: Tokenizer,
+        device: str | torch.device = "cpu",
+        stop_token: str | None = "<|endoftext|>",
+    ) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.stop_id = tokenizer.vocab_inv.get(stop_token.encode("utf-8")) if stop_token else None
+        self._stats: dict = {}
+
+    def _sync(self):
+        if torch.device(self.device).type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    @torch.no_grad()
+    def stream(
+        self,
+        prompts: list[str],
+        max_new_tokens: int = 128,
+        temperature: float = 1.0,
+        top_k: int | None = None,
+        top_p: float | None = None,
+        generator: torch.Generator | None = None,
+    ) -> Iterator[tuple[int, str]]:
+        """Yield `(prompt_index, text)` pieces of the completions as they are sampled."""
+        model = self.model
+        context_length = model.context_length
+        # Keep the end of prompts too long to leave room for one new token.
+        prompt_ids = [self.tokenizer.encode(p)[-(context_length - 1) :] for p in prompts]
+        if any(not ids for ids in prompt_ids):
+            # Start empty prompts at a document boundary, as after a separator.
+            if self.stop_id is None:
+                raise ValueError("Empty prompts need a stop_token to start from")
+            prompt_ids = [ids or [self.stop_id] for ids in prompt_ids]
+        batch_size = len(prompt_ids)
+        prompt_len = max(len(ids) for ids in prompt_ids)
+        max_new_tokens = min(max_new_tokens, context_length - prompt_len)
+
+        cache = model.new_kv_cache(batch_size, prompt_len + max_new_tokens)
+        ids = torch.zeros(batch_size, prompt_len, dtype=torch.long)
+        num_pad = torch.tensor([prompt_len - len(p) for p in prompt_ids])
+        for row, p in enumerate(prompt_ids):
+            ids[row, num_pad[row] :] = torch.tensor(p, dtype=torch.long)
+            cache.key_mask[row, : num_pad[row]] = False
+        positions = (torch.arange(prompt_len)[None, :] - num_pad[:, None]).clamp(min=0)
+        ids, positions = ids.to(self.device), positions.to(self.device)
+
+        was_training = model.training
+        model.eval()
+        try:
+            self._sync()
+            start = time.perf_counter()
+            logits = model(ids, positions, kv_cache=cache)[:, -1]
+            self._sync()
+            prefill_time = time.perf_counter() - start
+
+            decoders = [self.tokenizer.incremental_decoder() for _ in prompts]
+            finished = torch.zeros(batch_size, dtype=torch.bool, device=self.device)
+            next_positions = positions[:, -1:] + 1
+            num_generated = 0
+            # Only sampling and forward passes are timed, not the consumer of
+            # the yielded text.
+            decode_time = 0.0
+            for step in range(max_new_tokens):
+                start = time.perf_counter()
+                next_ids = sample_next_token(logits, temperature, top_k, top_p, generator)
+                if self.stop_id is not None:
+                    stopped = next_ids == self.stop_id
+                else:
+                    stopped = torch.zeros_like(finished)
+                emit = (~finished & ~stopped).tolist()
+                finished |= stopped
+                host_ids = next_ids.tolist()
+                done = bool(finished.all()) or step == max_new_tokens - 1
+                decode_time += time.perf_counter() - start
+                for row in range(batch_size):
+                    if emit[row]:
+                        num_generated += 1
+                        text = decoders[row].decode([host_ids[row]])
+                        if text:
+                            yield row, text
+                if done:
+                    break
+                start = time.perf_counter()
+                logits = model(next_ids[:, None], next_positions, kv_cache=cache)[:, -1]
+                next_positions = next_positions + 1
+                self._sync()
+                decode_time += time.perf_counter() - start
+            for row, decoder in enumerate(decoders):
+                text = decoder.flush()
+                if text:
+                    yield row, text
+        finally:
+            model.train(was_training)
+
+        num_prompt_tokens = sum(len(p) for p in prompt_ids)
+        self._stats = {
+            "num_prompts": batch_size,
+            "prefill_tokens": num_prompt_tokens,
+            "prefill_time": prefill_time,
+            "prefill_tokens_per_second": num_prompt_tokens / max(prefill_time, 1e-9),
+            "decode_tokens": num_generated,
+            "decode_time": decode_time,
+            "decode_tokens_per_second": num_generated / max(decode_time, 1e-9),
+        }
+
+    def generate(self, prompts: list[str], **kwargs) -> list[str]:
+        """Complete every prompt; see `stream` for the sampling arguments."""
+        pieces: list[list[str]] = [[] for _ in prompts]
+        for row, text in self.stream(prompts, **kwargs):
+            pieces[row].append(text)
+        return ["".join(p) for p in pieces]
+
+    def stats(self) -> dict:
+        return dict(self._stats)
@@ -0,0 +1,115 @@
+import time
+
+import torch
+
+from cs336_basics.model.transformer import TransformerLM
+
+
+def length_bucketed_batches(
+    lengths: list[int], max_tokens: int, pad_multiple: int = 8
+) -> list[list[int]]:
+    """
+    Group sequence indices into batches of similar length.
+
+    Sequences are sorted by length and cut into consecutive batches whose
+    padded size (batch size times the longest length, rounded up to
+    `pad_multiple`) stays within `max_tokens`. Rounding keeps the number of
+    distinct batch shapes small; sorting keeps padding to a minimum.
+    """
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        padded = -(-lengths[i] // pad_multiple) * pad_multiple
+        # Sorted ascending, so the new sequence is the longest of the batch.
+        if batch and (len(batch) + 1) * padded > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+@torch.no_grad()
+def score_token_ids(
+    model: TransformerLM,
+    token_ids: list[list[int]],
+    max_tokens: int = 4096,
+    pad_multiple: int = 8,
+    device: str | torch.device = "cpu",
+) -> tuple[list[float], dict]:
+    """
+    Summed log-probability of every sequence under `model`, in input order.
+    The first token of a sequence has no context and is not scored.
+
+    Batches are right-padded: with causal attention no real token attends to
+    padding, so only the padded targets have to be masked out of the sums.
+
+    Returns:
+        (log_probs, stats): per-sequence log-probs and throughput stats
+    """
+    log_probs = [0.0] * len(token_ids)
+    lengths = [len(ids) for ids in token_ids]
+    num_tokens = num_padded = 0
+    was_training = model.training
+    model.eval()
+    start = time.perf_counter()
+    try:
+        for batch in length_bucketed_batches(lengths, max_tokens, pad_multiple):
+            max_len = max(lengths[i] for i in batch)
+            if max_len < 2:
+                continue
+            # Inputs are all tokens but the last, padded to a multiple of `pad_multiple`.
+            input_len = min(-(-(max_len - 1) // pad_multiple) * pad_multiple, model.context_length)
+            seq_len = input_len + 1
+            ids = torch.zeros(len(batch), seq_len, dtype=torch.long)
+            batch_lengths = [min(lengths[i], seq_len) for i in batch]
+            for row, (i, length) in enumerate(zip(batch, batch_lengths)):
+                ids[row, :length] = torch.tensor(token_ids[i][:length])
+            ids = ids.to(device)
+            batch_lengths = torch.tensor(batch_lengths, device=device)
+
+            logits = model(ids[:, :-1]).float()
+            targets = ids[:, 1:]
+            target_logits = logits.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+            token_log_probs = target_logits - torch.logsumexp(logits, dim=-1)
+            mask = torch.arange(input_len, device=device) < (batch_lengths[:, None] - 1)
+            sums = token_log_probs.masked_fill(~mask, 0).sum(dim=-1).tolist()
+            for i, value in zip(batch, sums):
+                log_probs[i] = value
+            num_tokens += int(batch_lengths.sum())
+            num_padded += len(batch) * seq_len
+    finally:
+        model.train(was_training)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "num_sequences": len(token_ids),
+        "num_tokens": num_tokens,
+        "num_padded_tokens": num_padded,
+        "num_truncated": sum(length > model.context_length + 1 for length in lengths),
+        "padding_fraction": 1 - num_tokens / max(1, num_padded),
+        "elapsed": elapsed,
+        "tokens_per_second": num_tokens / max(elapsed, 1e-9),
+    }
+    return log_probs, stats
+
+
+def score_texts(
+    model: TransformerLM,
+    tokenizer,
+    texts: list[str],
+    max_tokens: int = 4096,
+    pad_multiple: int = 8,
+    device: str | torch.device = "cpu",
+    prefix_token: str | None = "<|endoftext|>",
+) -> tuple[list[float], dict]:
+    """
+    Tokenize `texts` and score them with `score_token_ids`. With
+    `prefix_token`, every text is scored after that token, so its first token
+    is scored too. Texts longer than the context are truncated (counted in
+    `stats["num_truncated"]`).
+    """
+    prefix = tokenizer.encode(prefix_token) if prefix_token else []
+    token_ids = [prefix + tokenizer.encode(text) for text in texts]
+    return score_token_ids(model, token_ids, max_tokens, pad_multiple, device)
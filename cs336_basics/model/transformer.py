@@ -0,0 +1,147 @@
+import torch
+from jaxtyping import Float, Int
+from torch import Tensor, nn
+from torch.utils.checkpoint import checkpoint
+
+from cs336_basics.model.attention import KVCache, MultiHeadSelfAttention, RotaryPositionalEmbedding
+from cs336_basics.model.layers import Embedding, Linear, RMSNorm, SwiGLU
+from cs336_basics.training.nn_utils import linear_cross_entropy
+
+
+class TransformerBlock(nn.Module):
+    """Pre-norm block: x + attn(ln1(x)), then x + ffn(ln2(x))."""
+
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        d_ff: int,
+        rope: RotaryPositionalEmbedding | None = None,
+        layer_idx: int = 0,
+        attn_backend: str = "reference",
+        device=None,
+        dtype=None,
+    ) -> None:
+        super().__init__()
+        self.ln1 = RMSNorm(d_model, device=device, dtype=dtype)
+        self.attn = MultiHeadSelfAttention(
+            d_model, num_heads, rope, layer_idx, attn_backend, device=device, dtype=dtype
+        )
+        self.ln2 = RMSNorm(d_model, device=device, dtype=dtype)
+        self.ffn = SwiGLU(d_model, d_ff, device=device, dtype=dtype)
+
+    def forward(
+        self,
+        x: Float[Tensor, "... seq d_model"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        kv_cache: KVCache | None = None,
+        segment_ids: Int[Tensor, "... seq"] | None = None,
+    ) -> Float[Tensor, "... seq d_model"]:
+        x = x + self.attn(self.ln1(x), token_positions, kv_cache, segment_ids)
+        return x + self.ffn(self.ln2(x))
+
+
+class TransformerLM(nn.Module):
+    """
+    Decoder-only language model. Its state dict uses the key names of the
+    reference implementation (`token_embeddings`, `layers.{i}.attn.output_proj`,
+    ..., `ln_final`, `lm_head`), except that attention has one packed
+    `qkv_proj`; reference state dicts with separate q/k/v weights load as
+    well. All layers share one RoPE module. `attn_backend` picks the
+    attention kernel, see `causal_attention`. For packed rows of several
+    documents, pass their `segment_ids` (and per-document `token_positions`)
+    so no token attends across a document boundary.
+
+    With `checkpoint_every = k > 0`, every k-th block (1: every block) is
+    run under activation checkpointing when gradients are needed: only its
+    input is kept and its activations are recomputed during backward, trading
+    about one extra forward of those blocks for their activation memory.
+    """
+
+    def __init__(
+        self,
+        vocab_size: int,
+        context_length: int,
+        d_model: int,
+        num_layers: int,
+        num_heads: int,
+        d_ff: int,
+        rope_theta: float = 10000.0,
+        attn_backend: str = "reference",
+        checkpoint_every: int = 0,
+        device=None,
+        dtype=None,
+    ) -> None:
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.context_length = context_length
+        self.checkpoint_every = checkpoint_every
+        rope = RotaryPositionalEmbedding(rope_theta, d_model // num_heads, context_length, device=device)
+        self.token_embeddings = Embedding(vocab_size, d_model, device=device, dtype=dtype)
+        self.layers = nn.ModuleList(
+            TransformerBlock(d_model, num_heads, d_ff, rope, i, attn_backend, device=device, dtype=dtype)
+            for i in range(num_layers)
+        )
+        self.ln_final = RMSNorm(d_model, device=device, dtype=dtype)
+        self.lm_head = Linear(d_model, vocab_size, device=device, dtype=dtype)
+
+    def new_kv_cache(self, batch_size: int, max_seq_len: int | None = None) -> KVCache:
+        attn = self.layers[0].attn
+        weight = attn.qkv_proj.weight
+        return KVCache(
+            len(self.layers),
+            batch_size,
+            attn.num_heads,
+            max_seq_len or self.context_length,
+            attn.d_k,
+            device=weight.device,
+            dtype=weight.dtype,
+        )
+
+    def hidden_states(
+        self,
+        in_indices: Int[Tensor, "batch seq"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        kv_cache: KVCache | None = None,
+        segment_ids: Int[Tensor, "batch seq"] | None = None,
+    ) -> Float[Tensor, "batch seq d_model"]:
+        """Final-norm outputs, i.e. the inputs of `lm_head`."""
+        seq_len = in_indices.shape[-1]
+        x = self.token_embeddings(in_indices)
+        checkpointing = self.checkpoint_every > 0 and kv_cache is None and torch.is_grad_enabled()
+        for i, layer in enumerate(self.layers):
+            if checkpointing and i % self.checkpoint_every == 0:
+                x = checkpoint(layer, x, token_positions, None, segment_ids, use_reentrant=False)
+            else:
+                x = layer(x, token_positions, kv_cache, segment_ids)
+        if kv_cache is not None:
+            kv_cache.advance(seq_len)
+        return self.ln_final(x)
+
+    def forward(
+        self,
+        in_indices: Int[Tensor, "batch seq"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        kv_cache: KVCache | None = None,
+        segment_ids: Int[Tensor, "batch seq"] | None = None,
+    ) -> Float[Tensor, "batch seq vocab_size"]:
+        """
+        Logits for `in_indices`. With `kv_cache`, `in_indices` are only the
+        tokens after the cached ones; positions then continue from the cache.
+        """
+        return self.lm_head(self.hidden_states(in_indices, token_positions, kv_cache, segment_ids))
+
+    def loss(
+        self,
+        in_indices: Int[Tensor, "batch seq"],
+        targets: Int[Tensor, "batch seq"],
+        token_positions: Int[Tensor, "... seq"] | None = None,
+        chunk_size: int = 8192,
+        segment_ids: Int[Tensor, "batch seq"] | None = None,
+    ) -> Float[Tensor, ""]:
+        """
+        Mean next-token cross-entropy, computed by `linear_cross_entropy` so
+        the (batch, seq, vocab_size) logits are never materialized.
+        """
+        hidden = self.hidden_states(in_indices, token_positions, segment_ids=segment_ids)
+        return linear_cross_entropy(hidden, self.lm_head.weight, targets, chunk_size)
@@ -0,0 +1,234 @@
+import hashlib
+import os
+from typing import BinaryIO
+
+import numpy as np
+import numpy.typing as npt
+
+
+class DocumentHashSet:
+    """
+    Set of fixed-size document digests.
+
+    Digests live in a sorted NumPy array of `V<digest_size>` items (8 or 16
+    bytes each, against ~70 bytes for a Python set entry), plus a small
+    Python set of recent additions that is merged into the array every
+    `compact_every` insertions. A saved set is loaded with `mmap_mode="r"`, so
+    a large set from earlier runs stays on disk until it is merged into.
+
+    With 64-bit digests the chance of any false duplicate among n documents is
+    about n**2 / 2**65 (~3e-4 for 1e8 documents); use `digest_size=16` when
+    that matters.
+    """
+
+    def __init__(
+        self,
+        digest_size: int = 8,
+        digests: npt.NDArray | None = None,
+        compact_every: int = 1 << 20,
+    ) -> None:
+        self.digest_size = digest_size
+        self.dtype = np.dtype(f"V{digest_size}")
+        self._sorted = digests if digests is not None else np.empty(0, dtype=self.dtype)
+        self._recent: set[bytes] = set()
+        self.compact_every = compact_every
+        # Digests added since the last `take_added`, once `track_added` was called.
+        self._added: list[bytes] | None = None
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, digest: bytes) -> bool:
+        if digest in self._recent:
+            return True
+        i = int(np.searchsorted(self._sorted, np.frombuffer(digest, dtype=self.dtype)[0]))
+        return i < len(self._sorted) and self._sorted[i].tobytes() == digest
+
+    def add(self, digest: bytes) -> bool:
+        """Add `digest`; return False if it was already in the set."""
+        if digest in self:
+            return False
+        self._recent.add(digest)
+        if self._added is not None:
+            self._added.append(digest)
+        if len(self._recent) >= self.compact_every:
+            self._compact()
+        return True
+
+    def contains_many(self, digests: npt.NDArray) -> npt.NDArray:
+        self._compact()
+        return np.isin(digests, self._sorted)
+
+    def add_many(self, digests: npt.NDArray):
+        self._compact()
+        self._sorted = np.union1d(self._sorted, digests)
+        if self._added is not None:
+            self._added.append(np.asarray(digests).tobytes())
+
+    def track_added(self):
+        """Start recording added digests for `take_added`."""
+        self._added = []
+
+    def take_added(self) -> bytes:
+        """The digests added since the previous call, concatenated."""
+        added, self._added = b"".join(self._added), []
+        return added
+
+    def _compact(self):
+        if not self._recent:
+            return
+        recent = np.frombuffer(b"".join(self._recent), dtype=self.dtype)
+        self._sorted = np.union1d(self._sorted, recent)
+        self._recent.clear()
+
+    def save(self, path: str | os.PathLike):
+        """Write the set to a `.npy` file, atomically replacing `path`."""
+        self._compact()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(self._sorted))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> "DocumentHashSet":
+        digests = np.load(path, mmap_mode="r")
+        return cls(digests.dtype.itemsize, digests)
+
+    @classmethod
+    def merge(cls, paths: list[str | os.PathLike]) -> "DocumentHashSet":
+        """Union of the sets saved by several (e.g. sharded) encoding runs."""
+        hash_sets = [cls.load(path) for path in paths]
+        merged = cls(hash_sets[0].digest_size)
+        for hash_set in hash_sets:
+            merged.add_many(hash_set._sorted)
+        return merged
+
+
+class HashSetJournal:
+    """
+    Durable copy of a `DocumentHashSet` that grows during a resumable run.
+
+    The set is saved once as a base snapshot; after that `sync` only appends
+    the digests added since the previous `sync` to a delta file and returns
+    the number of digests in it, to be journaled with the run's progress.
+    Each checkpoint then costs O(new digests) instead of O(set).
+    """
+
+    def __init__(
+        self,
+        base_path: str | os.PathLike,
+        delta_path: str | os.PathLike,
+        hash_set: DocumentHashSet,
+    ) -> None:
+        self.base_path = base_path
+        self.delta_path = delta_path
+        self.hash_set = hash_set
+        self.num_delta = 0
+        hash_set.track_added()
+
+    @classmethod
+    def create(cls, base_path, delta_path, hash_set: DocumentHashSet) -> "HashSetJournal":
+        hash_set.save(base_path)
+        open(delta_path, "wb").close()
+        return cls(base_path, delta_path, hash_set)
+
+    @classmethod
+    def resume(cls, base_path, delta_path, num_delta: int) -> "HashSetJournal":
+        """
+        Rebuild the set as of a journal entry that recorded `num_delta`;
+        digests appended after that entry are cut off.
+        """
+        base = np.load(base_path, mmap_mode="r")
+        hash_set = DocumentHashSet(base.dtype.itemsize, base)
+        with open(delta_path, "r+b") as f:
+            f.truncate(num_delta * base.dtype.itemsize)
+        hash_set.add_many(np.fromfile(delta_path, dtype=base.dtype))
+        journal = cls(base_path, delta_path, hash_set)
+        journal.num_delta = num_delta
+        return journal
+
+    def sync(self) -> int:
+        added = self.hash_set.take_added()
+        with open(self.delta_path, "ab") as f:
+            f.write(added)
+            f.flush()
+            os.fsync(f.fileno())
+        self.num_delta += len(added) // self.hash_set.digest_size
+        return self.num_delta
+
+    def remove(self):
+        for path in (self.base_path, self.delta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def document_log_dtype(digest_size: int) -> np.dtype:
+    """Record written to a `DocumentFilter` document log for every kept document."""
+    return np.dtype([("digest", f"V{digest_size}"), ("num_tokens", "<u8")])
+
+
+class DocumentFilter:
+    """
+    Encode text line by line and drop every document whose exact text was seen
+    before. A document ends right after `separator` (or at the end of the
+    input, see `finish`); its ids are held back until then.
+
+    `separator` must be a special token of the tokenizer: encoding then splits
+    around it, so encoding a line in pieces gives the same ids as encoding it
+    whole.
+    """
+
+    def __init__(
+        self,
+        encode,
+        separator: str,
+        hash_set: DocumentHashSet,
+        document_log: BinaryIO | None = None,
+    ) -> None:
+        """
+        With `document_log`, a `document_log_dtype` record of every kept
+        document is written to it as soon as the document is done.
+        """
+        self.encode = encode
+        self.separator = separator
+        self.hash_set = hash_set
+        self.document_log = document_log
+        self.num_documents = 0
+        self.num_dropped = 0
+        self.num_dropped_tokens = 0
+        self._hasher = hashlib.blake2b(digest_size=hash_set.digest_size)
+        self._pending: list[int] = []
+
+    def feed(self, line: str) -> list[int]:
+        """Encode `line` and return the ids of the documents it completed."""
+        pieces = line.split(self.separator)
+        out: list[int] = []
+        for i, piece in enumerate(pieces):
+            ends_document = i < len(pieces) - 1
+            if ends_document:
+                piece += self.separator
+            if piece:
+                self._hasher.update(piece.encode("utf-8"))
+                self._pending.extend(self.encode(piece))
+            if ends_document:
+                out.extend(self.finish())
+        return out
+
+    def finish(self) -> list[int]:
+        """End the current document; return its ids unless it is a duplicate."""
+        ids, self._pending = self._pending, []
+        if not ids:
+            return ids
+        digest = self._hasher.digest()
+        self._hasher = hashlib.blake2b(digest_size=self.hash_set.digest_size)
+
+        self.num_documents += 1
+        if not self.hash_set.add(digest):
+            self.num_dropped += 1
+            self.num_dropped_tokens += len(ids)
+            return []
+        if self.document_log is not None:
+            self.document_log.write(digest + len(ids).to_bytes(8, "little"))
+        return ids
@@ -0,0 +1,68 @@
+import json
+import os
+
+
+class EncodeJournal:
+    """
+    Append-only log of consistent points of an `encode_file_to_bin` run.
+
+    The first line describes the run (inputs, tokenizer, dtype); every later
+    line is an entry `{"file_index", "input_offset", "num_tokens"}` meaning
+    that the first `num_tokens` output tokens encode all inputs before
+    `file_index` plus the first `input_offset` (decompressed) bytes of input
+    `file_index`, with optional extra state of the run. Entries are only
+    appended after the output was fsync'd, and the journal itself is fsync'd
+    after every entry.
+    """
+
+    def __init__(self, path: str | os.PathLike, meta: dict) -> None:
+        self.path = path
+        # Round-trip through JSON so the comparison in `load` is like for like.
+        self.meta = json.loads(json.dumps(meta))
+
+    def load(self) -> dict | None:
+        """The last complete entry of a journal written for the same run, if any."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.readlines()
+        if not lines or not lines[0].endswith("\n"):
+            return None
+        try:
+            if json.loads(lines[0]) != self.meta:
+                return None
+        except json.JSONDecodeError:
+            return None
+
+        entry = None
+        for line in lines[1:]:
+            # A crash while appending leaves a truncated last line behind.
+            if not line.endswith("\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+        return entry
+
+    def start(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.meta) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, file_index: int, input_offset: int, num_tokens: int, **extra):
+        entry = {
+            "file_index": file_index,
+            "input_offset": input_offset,
+            "num_tokens": num_tokens,
+            **extra,
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
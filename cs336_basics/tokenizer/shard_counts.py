@@ -0,0 +1,147 @@
+"""
+Two-phase BPE training for corpora that are too large to scan on one machine.
+
+    # on every machine i of n (shared filesystem or copied afterwards)
+    python -m cs336_basics.tokenizer.shard_counts count data/owt_*.txt.gz \
+        --special-tokens "<|endoftext|>" --num-shards n --shard-index i \
+        --out counts/shard-i.npz
+
+    # once
+    python -m cs336_basics.tokenizer.shard_counts merge-train "counts/*.npz" \
+        --vocab-size 32000 --save-path datasets/owt
+"""
+
+import argparse
+import json
+import os
+from collections import Counter
+
+import numpy as np
+
+from cs336_basics.tokenizer.tokenizer import count_pre_tokens, train_bpe_from_counts
+from cs336_basics.tokenizer.utils import expand_input_paths, print_color, timeit
+
+COUNTS_FORMAT_VERSION = 1
+
+
+def save_pre_token_counts(
+    word_counter: Counter,
+    out_path: str | os.PathLike,
+    special_tokens: list[str] | None = None,
+):
+    """
+    Store pre-token counts as a `.npz` file: every pre-token's bytes are
+    concatenated into one uint8 array, addressed by `offsets`, next to an int64
+    array of `counts`. The layout only depends on NumPy, so count files can be
+    produced and consumed on different machines.
+    """
+    words = list(word_counter.keys())
+    lengths = np.fromiter((len(w) for w in words), dtype=np.int64, count=len(words))
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(b"".join(bytes(w) for w in words), dtype=np.uint8)
+    counts = np.fromiter(
+        (word_counter[w] for w in words), dtype=np.int64, count=len(words)
+    )
+    meta = {"version": COUNTS_FORMAT_VERSION, "special_tokens": special_tokens or []}
+
+    # np.savez appends ".npz" to paths without it; write through a file object
+    # so the caller's name is kept exactly.
+    with open(out_path, "wb") as f:
+        np.savez(
+            f, data=data, offsets=offsets, counts=counts, meta=np.array(json.dumps(meta))
+        )
+
+
+def load_pre_token_counts(path: str | os.PathLike) -> tuple[Counter, list[str]]:
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        if meta["version"] != COUNTS_FORMAT_VERSION:
+            raise ValueError(
+                f"{path}: unsupported counts format version {meta['version']}"
+            )
+        data = f["data"].tobytes()
+        offsets = f["offsets"].tolist()
+        counts = f["counts"].tolist()
+
+    word_counter = Counter()
+    for start, end, count in zip(offsets[:-1], offsets[1:], counts):
+        word_counter[tuple(data[start:end])] += count
+    return word_counter, meta["special_tokens"]
+
+
+def merge_pre_token_counts(
+    paths: str | os.PathLike | list[str | os.PathLike],
+) -> tuple[Counter, list[str]]:
+    """Sum the counts of several count files that share the same special tokens."""
+    word_counter = Counter()
+    special_tokens: list[str] | None = None
+    for path in expand_input_paths(paths):
+        partial_counter, file_special_tokens = load_pre_token_counts(path)
+        if special_tokens is None:
+            special_tokens = file_special_tokens
+        elif file_special_tokens != special_tokens:
+            raise ValueError(
+                f"{path}: special tokens {file_special_tokens} differ from {special_tokens}"
+            )
+        word_counter.update(partial_counter)
+
+    if special_tokens is None:
+        raise ValueError("No count files given")
+    return word_counter, special_tokens
+
+
+@timeit
+def merge_train(
+    paths: str | os.PathLike | list[str | os.PathLike],
+    vocab_size: int,
+    save_path: str | os.PathLike | None = None,
+) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
+    word_counter, special_tokens = merge_pre_token_counts(paths)
+    return train_bpe_from_counts(
+        word_counter, vocab_size, special_tokens, save_path=save_path
+    )
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count_parser = subparsers.add_parser(
+        "count", help="write the pre-token counts of one input shard"
+    )
+    count_parser.add_argument("inputs", nargs="+", help="files or glob patterns")
+    count_parser.add_argument("--out", required=True)
+    count_parser.add_argument("--special-tokens", nargs="*", default=[])
+    count_parser.add_argument("--num-shards", type=int, default=1)
+    count_parser.add_argument("--shard-index", type=int, default=0)
+    count_parser.add_argument("--desired-num-chunks", type=int, default=5)
+    count_parser.add_argument("--num-workers", type=int, default=None)
+
+    merge_parser = subparsers.add_parser(
+        "merge-train", help="reduce count files and run the BPE merges"
+    )
+    merge_parser.add_argument("counts", nargs="+", help="count files or glob patterns")
+    merge_parser.add_argument("--vocab-size", type=int, required=True)
+    merge_parser.add_argument("--save-path", required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "count":
+        word_counter = count_pre_tokens(
+            args.inputs,
+            args.special_tokens,
+            verbose=True,
+            num_shards=args.num_shards,
+            shard_index=args.shard_index,
+            desired_num_chunks=args.desired_num_chunks,
+            num_workers=args.num_workers,
+        )
+        save_pre_token_counts(word_counter, args.out, args.special_tokens)
+        print_color(f"Wrote {len(word_counter)} pre-token counts to {args.out}")
+    else:
+        merge_train(args.counts, args.vocab_size, args.save_path)
+        print_color(f"BPE tokenizer trained and saved to {args.save_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
-from collections import Counter, defaultdict
-from multiprocessing import Process, Queue
+from collections import Counter, defaultdict, deque
+from itertools import islice
+from multiprocessing import Pool
 import regex as re
+import codecs
+import contextlib
 import os
 import numpy as np
 import json
 from cs336_basics.tokenizer.utils import (
     print_color,
     find_chunk_boundaries,
+    expand_input_paths,
+    is_compressed,
+    iter_text_blocks,
+    open_input,
     timeit,
     save_vocab_and_merges,
 )
@@ -16,6 +23,14 @@ from cs336_basics.tokenizer.merge_fn import (
     pop_most_frequent_pair,
     merge_pairs_with_heap_index,
 )
+from cs336_basics.data.shard import ShardWriter, smallest_token_dtype, tokenizer_hash
+from cs336_basics.tokenizer.dedup import (
+    DocumentFilter,
+    DocumentHashSet,
+    HashSetJournal,
+    document_log_dtype,
+)
+from cs336_basics.tokenizer.journal import EncodeJournal
 from tqdm import trange, tqdm
 from typing import Iterable, Iterator
 
@@ -160,63 +175,135 @@ def update_vocab(vocab: dict[int, bytes], pair: tuple[int, int]) -> int:
     return new_id
 
 
-def pre_tokenize_string_worker(*args):
-    input_path, special_tokens, queue, start, end, include_special = args
-    with open(input_path, "rb") as f:
+def pre_tokenize_string_worker(task: tuple) -> Counter:
+    source, special_tokens, start, end, include_special = task
+    # Blocks of compressed inputs are decoded by the reader and sent as text.
+    if start is None:
+        return pre_tokenize(source, special_tokens, include_special)
+
+    with open(source, "rb") as f:
         f.seek(start)
         raw = f.read(end - start)
     chunk = raw.decode("utf-8")
-    word_counter = pre_tokenize(chunk, special_tokens, include_special)
-    queue.put(word_counter)
+    return pre_tokenize(chunk, special_tokens, include_special)
+
+
+def pre_tokenize_tasks(
+    input_paths: list[str],
+    special_tokens: list[str] | None,
+    desired_num_chunks: int,
+    block_size: int = 1 << 24,
+) -> Iterator[tuple]:
+    """
+    Yield tasks for `pre_tokenize_string_worker`: byte ranges of plain files,
+    and for compressed files (which cannot be seeked) the decompressed text
+    itself, read block by block. Both are cut at newlines.
+    """
+    for path in input_paths:
+        if is_compressed(path):
+            with open_input(path) as (stream, _):
+                for block in iter_text_blocks(stream, "\n", block_size):
+                    yield (block, special_tokens, None, None, False)
+            continue
+
+        with open(path, "rb") as f:
+            chunk_boundaries = find_chunk_boundaries(
+                f,
+                desired_num_chunks=desired_num_chunks,
+                split_special_token=b"\n",
+            )
+        for start, end in zip(chunk_boundaries[:-1], chunk_boundaries[1:]):
+            yield (path, special_tokens, start, end, False)
+
+
+def count_pre_tokens(
+    input_path: str | os.PathLike | list[str | os.PathLike],
+    special_tokens: list[str] | None = None,
+    verbose: bool = False,
+    **kwargs,
+) -> Counter:
+    """统计预分词频率
+
+    Args:
+        input_path: 单个文件、glob 或它们的列表，支持 `.gz`/`.xz`/`.bz2`
+        special_tokens (list[str] | None, optional): 特殊token. Defaults to None.
+        num_shards / shard_index: 只统计 `tasks[shard_index::num_shards]`，
+            用于把同一语料的扫描分到多台机器上
+        block_size: 压缩文件每次解压并分给 worker 的字节数
+
+    Returns:
+        Counter: pre-token (utf-8 字节元组) -> 频率
+    """
+    # 1.1 Split every input into tasks: byte ranges of plain files, decompressed
+    # blocks of compressed ones
+    input_paths = expand_input_paths(input_path)
+    num_shards = kwargs.get("num_shards", 1)
+    shard_index = kwargs.get("shard_index", 0)
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index {shard_index} out of range for {num_shards} shards")
+    tasks = islice(
+        pre_tokenize_tasks(
+            input_paths,
+            special_tokens,
+            kwargs.get("desired_num_chunks", 5) * num_shards,
+            kwargs.get("block_size", 1 << 24),
+        ),
+        shard_index,
+        None,
+        num_shards,
+    )
+
+    # 1.2 Count word frequencies across chunks using a worker pool. Pool.imap
+    # would drain the task iterator (and so decompress whole files) up front,
+    # so only a few tasks per worker are kept in flight.
+    num_workers = kwargs.get("num_workers") or os.cpu_count() or 1
+    word_counter = Counter()
+    num_tasks = 0
+    with Pool(num_workers) as pool:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(pool.apply_async(pre_tokenize_string_worker, (task,)))
+            num_tasks += 1
+            if len(in_flight) >= 2 * num_workers:
+                word_counter.update(in_flight.popleft().get())
+        while in_flight:
+            word_counter.update(in_flight.popleft().get())
+
+    if verbose:
+        print_color(
+            f"Pre-tokenized {num_tasks} chunks in {len(input_paths)} files."
+        )
+    return word_counter
 
 
 @timeit
 def train_bpe(
-    input_path: str | os.PathLike,
+    input_path: str | os.PathLike | list[str | os.PathLike],
     vocab_size: int,
     special_tokens: list[str] | None = None,
     verbose: bool = False,
     **kwargs,
 ) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
-    num_merges = vocab_size - 256 - (len(special_tokens) if special_tokens else 0)
-    vocab: dict[int, bytes] = init_vocab(special_tokens)
-    merges: list[tuple[bytes, bytes]] = []
-
+    """
+    `input_path` may be a single file, a glob pattern or a list of either;
+    `.gz`/`.xz`/`.bz2` inputs are decompressed on the fly.
+    """
     # 1. Pre-tokenization
-    # 1.1 Find chunk boundaries
-    with open(input_path, "rb") as f:
-        chunk_boundaries = find_chunk_boundaries(
-            f,
-            desired_num_chunks=kwargs.get("desired_num_chunks", 5),
-            split_special_token=b"\n",
-        )
+    word_counter = count_pre_tokens(input_path, special_tokens, verbose, **kwargs)
 
-    if verbose:
-        print_color(
-            f"Identified {len(chunk_boundaries) - 1} chunks for pre-tokenization."
-        )
+    # 2. Merges
+    return train_bpe_from_counts(word_counter, vocab_size, special_tokens, **kwargs)
 
-    # 1.2 Count word frequencies across chunks using multiprocessing
-    queue = Queue()
-    processes: list[Process] = []
-    for start, end in zip(chunk_boundaries[:-1], chunk_boundaries[1:]):
-        p = Process(
-            target=pre_tokenize_string_worker,
-            args=(input_path, special_tokens, queue, start, end, False),
-        )
-        processes.append(p)
-        p.start()
 
-    word_counter = Counter()
-    for _ in range(len(processes)):
-        try:
-            partial_counter = queue.get()
-            word_counter.update(partial_counter)
-        except Exception as e:
-            print_color(f"Error in pre-tokenize_string_worker: {e}", "red")
-            continue
-    for p in processes:
-        p.join()
+def train_bpe_from_counts(
+    word_counter: Counter,
+    vocab_size: int,
+    special_tokens: list[str] | None = None,
+    **kwargs,
+) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
+    num_merges = vocab_size - 256 - (len(special_tokens) if special_tokens else 0)
+    vocab: dict[int, bytes] = init_vocab(special_tokens)
+    merges: list[tuple[bytes, bytes]] = []
 
     pairs_counter = Counter()
     pair_to_words: dict[tuple[int, int], set[tuple[int, ...]]] = defaultdict(set)
@@ -398,6 +485,9 @@ class Tokenizer:
         tokens = b"".join(self.vocab.get(i, b"\xef\xbf\xbd") for i in ids)
         return tokens.decode("utf-8", errors="replace")
 
+    def incremental_decoder(self) -> "IncrementalDecoder":
+        return IncrementalDecoder(self.vocab)
+
     @classmethod
     def from_files(
         cls,
@@ -432,20 +522,406 @@ class Tokenizer:
         return cls(vocab, merges, special_tokens_list)
 
 
-def encode_file_to_bin(tokenizer, text_path, out_bin_path, dtype=np.uint16):
-    total_bytes = os.path.getsize(text_path)
+class IncrementalDecoder:
+    """
+    Decode ids as they arrive. A character whose UTF-8 bytes are split across
+    tokens is only returned once it is complete, so the pieces joined together
+    equal `Tokenizer.decode` of all ids.
+    """
+
+    def __init__(self, vocab: dict[int, bytes]) -> None:
+        self.vocab = vocab
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def decode(self, ids: list[int]) -> str:
+        return self._decoder.decode(b"".join(self.vocab.get(i, b"\xef\xbf\xbd") for i in ids))
+
+    def flush(self) -> str:
+        return self._decoder.decode(b"", final=True)
+
+
+def _iter_line_blocks(stream, block_size=1 << 22, delimiter=b"\n"):
+    """
+    Read `stream` in blocks of about `block_size` bytes that end right after
+    `delimiter` (a newline, or a special token), and yield `(lines, offset)`
+    where `offset` is the number of bytes consumed once the block is done.
+    Lines are split and newlines translated exactly like
+    `open(path, encoding="utf-8")` does, except that a line may be split right
+    after a special token delimiter, which does not change its encoding.
+    """
+    offset = 0
+    pending = b""
+    while True:
+        data = stream.read(block_size)
+        if data:
+            data = pending + data
+            cut = data.rfind(delimiter) + len(delimiter)
+            if cut < len(delimiter):
+                pending = data
+                continue
+            block, pending = data[:cut], data[cut:]
+        else:
+            block, pending = pending, b""
+            if not block:
+                return
+
+        offset += len(block)
+        text = block.decode("utf-8")
+        # Universal newlines: "\r\n" and a lone "\r" both end a line as "\n".
+        # A block never ends between "\r" and "\n" since it is cut after the
+        # delimiter.
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = [line + "\n" for line in text.split("\n")]
+        lines[-1] = lines[-1][:-1]
+        if not lines[-1]:
+            lines.pop()
+        yield lines, offset
+
+
+class _TokenBuffer:
+    """Collect token ids in a reusable array and hand them to `write` in bulk."""
+
+    def __init__(self, write, dtype, capacity=1 << 22):
+        self.write = write
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, token_ids: list[int]):
+        n = len(token_ids)
+        if self.size + n > len(self.buffer):
+            self.flush()
+            if n > len(self.buffer):
+                self.write(np.array(token_ids, dtype=self.buffer.dtype))
+                return
+        self.buffer[self.size : self.size + n] = token_ids
+        self.size += n
+
+    def flush(self):
+        if self.size:
+            self.write(self.buffer[: self.size])
+            self.size = 0
+
+
+def _encode_stream_to_file(
+    tokenizer,
+    text_path,
+    write,
+    dtype,
+    p_bar=None,
+    start_offset=0,
+    checkpoint=None,
+    checkpoint_interval=1 << 26,
+    doc_filter=None,
+    block_size=1 << 22,
+):
+    """
+    Encode `text_path` line by line, starting at byte `start_offset` of the
+    decompressed input, and pass the ids to `write` in multi-megabyte arrays.
+    `checkpoint(offset)` is called roughly every `checkpoint_interval` input
+    bytes, always at a line boundary and after everything before it was written.
+
+    With a `DocumentFilter`, blocks end right after its separator, so at every
+    checkpoint all documents read so far have been either written or dropped.
+    """
+    token_buffer = _TokenBuffer(write, dtype)
+    encode = tokenizer.encode if doc_filter is None else doc_filter.feed
+    delimiter = b"\n" if doc_filter is None else doc_filter.separator.encode("utf-8")
+    with open_input(text_path) as (stream, raw):
+        # Compressed streams emulate the seek by decompressing up to the offset.
+        stream.seek(start_offset)
+        last_pos = raw.tell()
+        last_checkpoint = start_offset
+        for lines, offset in _iter_line_blocks(stream, block_size, delimiter):
+            for line in lines:
+                token_buffer.extend(encode(line))
+
+            if p_bar is not None:
+                pos = raw.tell()
+                p_bar.update(pos - last_pos)
+                last_pos = pos
+            offset += start_offset
+            if checkpoint is not None and offset - last_checkpoint >= checkpoint_interval:
+                token_buffer.flush()
+                checkpoint(offset)
+                last_checkpoint = offset
+    if doc_filter is not None:
+        # The end of a file also ends its last document.
+        token_buffer.extend(doc_filter.finish())
+    token_buffer.flush()
+
+
+_worker_tokenizer: "Tokenizer | None" = None
+
+
+def _init_encode_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _encode_file_worker(task: tuple) -> tuple[str, int, int]:
+    text_path, part_path, dtype, doc_separator, digest_size, block_size = task
+    with contextlib.ExitStack() as stack:
+        doc_filter = None
+        if digest_size:
+            # Duplicates within the file are dropped here; the parent drops the
+            # documents that were already seen in earlier files, reading the
+            # kept ones back from the document log.
+            doc_filter = DocumentFilter(
+                _worker_tokenizer.encode,
+                doc_separator,
+                DocumentHashSet(digest_size),
+                document_log=stack.enter_context(open(f"{part_path}.docs", "wb")),
+            )
+        f_out = stack.enter_context(open(part_path, "wb"))
+        _encode_stream_to_file(
+            _worker_tokenizer,
+            text_path,
+            f_out.write,
+            dtype,
+            doc_filter=doc_filter,
+            block_size=block_size,
+        )
+
+    if doc_filter is None:
+        return part_path, 0, 0
+    return part_path, doc_filter.num_dropped, doc_filter.num_dropped_tokens
+
+
+def encode_file_to_bin(
+    tokenizer,
+    text_path,
+    out_bin_path,
+    dtype=None,
+    num_workers=None,
+    doc_separator="<|endoftext|>",
+    resume=True,
+    journal_interval=1 << 26,
+    dedup=False,
+    dedup_hashes=None,
+    dedup_digest_size=8,
+    block_size=1 << 22,
+) -> dict[str, int]:
+    """
+    Encode one or more text files (a path, a glob pattern or a list of either,
+    plain or `.gz`/`.xz`/`.bz2`) into a single token shard (see
+    `cs336_basics.data.shard`). With several inputs, files are encoded in
+    parallel into temporary parts that are appended in input order.
+
+    `dtype=None` picks the narrowest dtype that holds every id of the
+    tokenizer's vocab. If `doc_separator` is in the vocab, the shard also gets
+    a document index with one entry after every separator.
+
+    Progress is journaled to `<out_bin_path>.journal` (see `EncodeJournal`)
+    about every `journal_interval` input bytes and after every file, at the
+    end of a read block (`block_size` bytes, cut after a line). With
+    `resume=True`, a run that finds the journal of an interrupted run over the
+    same inputs continues from its last entry instead of starting over.
+
+    With `dedup=True`, every `doc_separator`-terminated document whose exact
+    text was already seen is skipped (see `DocumentFilter`); the first
+    occurrence in input order is kept, with or without workers.
+    `dedup_hashes` names a `DocumentHashSet` file that is loaded first if it
+    exists and holds the updated set afterwards, so that separately encoded
+    shards (e.g. train after eval) can share one set.
+
+    Returns:
+        dict[str, int]: number of tokens written and of duplicate documents
+        and tokens that were dropped
+    """
+    text_paths = expand_input_paths(text_path)
+    total_bytes = sum(os.path.getsize(path) for path in text_paths)
+
+    vocab_size = max(tokenizer.vocab) + 1
+    doc_separator_id = (
+        tokenizer.vocab_inv.get(doc_separator.encode("utf-8"))
+        if doc_separator
+        else None
+    )
+    if dedup and doc_separator not in tokenizer.special_tokens:
+        raise ValueError(
+            f"dedup needs doc_separator {doc_separator!r} to be a special token"
+        )
+    fingerprint = tokenizer_hash(tokenizer)
+    dtype = np.dtype(smallest_token_dtype(vocab_size) if dtype is None else dtype)
+
+    journal = EncodeJournal(
+        f"{out_bin_path}.journal",
+        {
+            "inputs": [os.path.abspath(path) for path in text_paths],
+            "input_sizes": [os.path.getsize(path) for path in text_paths],
+            "tokenizer_hash": fingerprint.hex(),
+            "dtype": dtype.name,
+            "doc_separator": doc_separator,
+            "dedup_digest_size": dedup_digest_size if dedup else 0,
+        },
+    )
+    entry = journal.load() if resume and os.path.exists(out_bin_path) else None
+    stats = {"num_tokens": 0, "num_duplicate_docs": 0, "num_duplicate_tokens": 0}
+    if entry is None:
+        start_file, start_offset, resume_tokens = 0, 0, None
+        journal.start()
+    else:
+        start_file = entry["file_index"]
+        start_offset = entry["input_offset"]
+        resume_tokens = entry["num_tokens"]
+        stats["num_duplicate_docs"] = entry.get("num_duplicate_docs", 0)
+        stats["num_duplicate_tokens"] = entry.get("num_duplicate_tokens", 0)
+        print_color(
+            f"Resuming {out_bin_path} at input {start_file}, byte {start_offset} "
+            f"({resume_tokens} tokens kept)"
+        )
+
+    hash_set = hash_journal = None
+    if dedup:
+        # The set is saved once per run; journal entries only append new digests.
+        base_path, delta_path = f"{out_bin_path}.dedup-base.npy", f"{out_bin_path}.dedup-delta.bin"
+        if entry is not None:
+            hash_journal = HashSetJournal.resume(base_path, delta_path, entry["dedup_delta_digests"])
+        else:
+            if dedup_hashes is not None and os.path.exists(dedup_hashes):
+                initial = DocumentHashSet.load(dedup_hashes)
+            else:
+                initial = DocumentHashSet(dedup_digest_size)
+            hash_journal = HashSetJournal.create(base_path, delta_path, initial)
+        hash_set = hash_journal.hash_set
+
+    with ShardWriter(
+        out_bin_path,
+        vocab_size,
+        fingerprint,
+        doc_separator_id,
+        dtype,
+        resume_tokens=resume_tokens,
+    ) as writer:
+
+        def checkpoint(file_index: int, input_offset: int, doc_filter=None):
+            writer.sync()
+            extra = {}
+            if doc_filter is not None:
+                stats["num_duplicate_docs"] += doc_filter.num_dropped
+                stats["num_duplicate_tokens"] += doc_filter.num_dropped_tokens
+                doc_filter.num_dropped = doc_filter.num_dropped_tokens = 0
+            if hash_journal is not None:
+                # Digests appended after the last entry are cut off on resume, so
+                # the set is never ahead of the journal.
+                extra = {
+                    "dedup_delta_digests": hash_journal.sync(),
+                    "num_duplicate_docs": stats["num_duplicate_docs"],
+                    "num_duplicate_tokens": stats["num_duplicate_tokens"],
+                }
+            journal.record(file_index, input_offset, writer.num_tokens, **extra)
 
-    with open(text_path, encoding="utf-8") as f_in, open(out_bin_path, "wb") as f_out:
         p_bar = tqdm(
-            total=total_bytes, desc="Encoding to binary", unit="B", unit_scale=True
+            total=total_bytes,
+            initial=sum(os.path.getsize(path) for path in text_paths[:start_file]),
+            desc="Encoding to binary",
+            unit="B",
+            unit_scale=True,
+        )
+
+        remaining = list(enumerate(text_paths))[start_file:]
+        num_workers = min(len(remaining), num_workers or os.cpu_count() or 1)
+        # A partially encoded file is finished in this process before the
+        # remaining files are handed to the pool.
+        serial = remaining if num_workers <= 1 else remaining[: int(start_offset > 0)]
+        remaining = remaining[len(serial) :]
+        for i, path in serial:
+            doc_filter = (
+                DocumentFilter(tokenizer.encode, doc_separator, hash_set)
+                if dedup
+                else None
+            )
+            _encode_stream_to_file(
+                tokenizer,
+                path,
+                writer.write,
+                dtype,
+                p_bar,
+                start_offset=start_offset,
+                checkpoint=lambda offset: checkpoint(i, offset, doc_filter),
+                checkpoint_interval=journal_interval,
+                doc_filter=doc_filter,
+                block_size=block_size,
+            )
+            start_offset = 0
+            checkpoint(i + 1, 0, doc_filter)
+
+        if remaining:
+            tasks = [
+                (
+                    path,
+                    f"{out_bin_path}.part{i}",
+                    dtype,
+                    doc_separator,
+                    dedup_digest_size if dedup else 0,
+                    block_size,
+                )
+                for i, path in remaining
+            ]
+            with Pool(
+                min(len(tasks), num_workers),
+                initializer=_init_encode_worker,
+                initargs=(tokenizer,),
+            ) as pool:
+                # imap keeps input order, so parts are appended as soon as their
+                # predecessors are done.
+                for (i, path), (part_path, num_dropped, num_dropped_tokens) in zip(
+                    remaining, pool.imap(_encode_file_worker, tasks)
+                ):
+                    stats["num_duplicate_docs"] += num_dropped
+                    stats["num_duplicate_tokens"] += num_dropped_tokens
+                    if dedup:
+                        _append_new_documents(part_path, writer, dtype, hash_set, stats)
+                    else:
+                        with open(part_path, "rb") as f_part:
+                            while block := f_part.read(1 << 24):
+                                writer.write(np.frombuffer(block, dtype=dtype))
+                    os.remove(part_path)
+                    checkpoint(i + 1, 0)
+                    p_bar.update(os.path.getsize(path))
+
+        stats["num_tokens"] = writer.num_tokens
+
+    if dedup and dedup_hashes is not None:
+        hash_set.save(dedup_hashes)
+    # The journal goes first: once it is gone nothing resumes from the hash
+    # set files, so a crash in between only leaves them behind.
+    journal.remove()
+    if dedup:
+        hash_journal.remove()
+        print_color(
+            f"Dropped {stats['num_duplicate_docs']} duplicate documents "
+            f"({stats['num_duplicate_tokens']} tokens)"
         )
+    return stats
 
-        for line in f_in:
-            token_ids = tokenizer.encode(line)
-            arr = np.array(token_ids, dtype=dtype)
-            arr.tofile(f_out)
 
-            p_bar.update(len(line.encode("utf-8")))
+def _append_new_documents(
+    part_path, writer, dtype, hash_set, stats, docs_per_read=1 << 20
+):
+    """
+    Append the documents of a worker's part that no earlier file contained.
+    The part is streamed document by document; its document log is read
+    `docs_per_read` records at a time.
+    """
+    record_dtype = document_log_dtype(hash_set.digest_size)
+    itemsize = np.dtype(dtype).itemsize
+    with open(f"{part_path}.docs", "rb") as f_docs, open(part_path, "rb") as f_part:
+        while len(records := np.fromfile(f_docs, dtype=record_dtype, count=docs_per_read)):
+            digests, lengths = records["digest"], records["num_tokens"]
+            seen = hash_set.contains_many(digests)
+            # Within a part every digest is unique, so they can be added at once.
+            hash_set.add_many(digests[~seen])
+            stats["num_duplicate_docs"] += int(seen.sum())
+            stats["num_duplicate_tokens"] += int(lengths[seen].sum())
+
+            for is_seen, length in zip(seen.tolist(), lengths.tolist()):
+                if is_seen:
+                    f_part.seek(length * itemsize, os.SEEK_CUR)
+                else:
+                    writer.write(np.fromfile(f_part, dtype=dtype, count=length))
+    os.remove(f"{part_path}.docs")
 
 
 def load_tokenizer_from_dir(dir_path: str) -> Tokenizer:
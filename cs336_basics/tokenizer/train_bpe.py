@@ -1,6 +1,5 @@
 import os
 
-import numpy as np
 from tqdm import tqdm
 
 from cs336_basics.tokenizer.tokenizer import (
@@ -18,7 +17,7 @@ TINY_STORIES = {
 }
 
 OWT = {
-    "train_data_path": "data/owt_train.txt",
+    "train_data_path": "data/owt_train.txt.gz",
     "vocab_size": 32_000,
     "special_tokens": [],
     "save_dir": "./datasets/owt",
@@ -59,13 +58,9 @@ if __name__ == "__main__":
     tokenizer = load_tokenizer_from_dir(dataset["save_dir"])
 
     out_bin_path = os.path.join(dataset["save_dir"], "train.bin")
-    encode_file_to_bin(
-        tokenizer, dataset["train_data_path"], out_bin_path, dtype=np.uint16
-    )
+    encode_file_to_bin(tokenizer, dataset["train_data_path"], out_bin_path)
     print(f"Encoded training data saved to {out_bin_path}")
 
     out_bin_eval_path = os.path.join(dataset["save_dir"], "eval.bin")
-    encode_file_to_bin(
-        tokenizer, dataset["dev_data_path"], out_bin_eval_path, dtype=np.uint16
-    )
+    encode_file_to_bin(tokenizer, dataset["dev_data_path"], out_bin_eval_path)
     print(f"Encoded evaluation data saved to {out_bin_eval_path}")
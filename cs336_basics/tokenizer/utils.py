@@ -1,4 +1,11 @@
 from typing import BinaryIO
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+import bz2
+import codecs
+import glob
+import gzip
+import lzma
 import os
 import time
 from functools import wraps
@@ -61,6 +68,94 @@ def find_chunk_boundaries(
     return sorted(set(chunk_boundaries))
 
 
+# Streaming decompressors keyed by file suffix. They wrap an already opened raw
+# file so callers can still report progress in on-disk (compressed) bytes.
+DECOMPRESSORS = {
+    ".gz": lambda raw: gzip.GzipFile(fileobj=raw, mode="rb"),
+    ".xz": lambda raw: lzma.LZMAFile(raw, mode="rb"),
+    ".bz2": lambda raw: bz2.BZ2File(raw, mode="rb"),
+}
+
+
+def is_compressed(path: str | os.PathLike) -> bool:
+    return os.path.splitext(os.fspath(path))[1] in DECOMPRESSORS
+
+
+def expand_input_paths(
+    input_path: str | os.PathLike | Iterable[str | os.PathLike],
+) -> list[str]:
+    """Expand a path, a glob pattern, or a list of either into a list of files.
+
+    The order of the given entries is kept; every glob pattern is expanded in
+    sorted order so that results are reproducible across machines.
+    """
+    if isinstance(input_path, (str, os.PathLike)):
+        input_path = [input_path]
+
+    paths: list[str] = []
+    for entry in input_path:
+        entry = os.fspath(entry)
+        if glob.has_magic(entry):
+            matches = sorted(glob.glob(entry))
+            if not matches:
+                raise FileNotFoundError(f"No input files match {entry!r}")
+            paths.extend(matches)
+        else:
+            paths.append(entry)
+    return paths
+
+
+@contextmanager
+def open_input(path: str | os.PathLike) -> Iterator[tuple[BinaryIO, BinaryIO]]:
+    """Open a plain or compressed input file for streaming reads.
+
+    Yields:
+        (stream, raw): `stream` yields decompressed bytes, `raw` is the on-disk
+        file whose `tell()` can be used for progress reporting.
+    """
+    with open(path, "rb") as raw:
+        decompressor = DECOMPRESSORS.get(os.path.splitext(os.fspath(path))[1])
+        if decompressor is None:
+            yield raw, raw
+        else:
+            with decompressor(raw) as stream:
+                yield stream, raw
+
+
+def iter_text_blocks(
+    stream: BinaryIO, delimiter: str = "\n", block_size: int = 1 << 24
+) -> Iterator[str]:
+    """
+    Incrementally decode a UTF-8 byte stream into text blocks of roughly
+    `block_size` bytes. Every block except the first starts with `delimiter`,
+    mirroring how `find_chunk_boundaries` places chunk starts. Text without a
+    delimiter is collected until one shows up, so a block may be longer.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    # Pieces of the current block; only the newest piece is searched for the
+    # delimiter, so a long run without one is not copied again on every read.
+    pending: list[str] = []
+    while True:
+        data = stream.read(block_size)
+        text = decoder.decode(data, final=not data)
+        if not data:
+            pending.append(text)
+            block = "".join(pending)
+            if block:
+                yield block
+            return
+
+        cut = text.rfind(delimiter)
+        if cut == -1 or (cut == 0 and not any(pending)):
+            pending.append(text)
+            continue
+        pending.append(text[:cut])
+        block = "".join(pending)
+        if block:
+            yield block
+        pending = [text[cut:]]
+
+
 def timeit(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -0,0 +1,115 @@
+"""
+Micro-benchmarks of training components, on CPU unless a device is given.
+
+    python -m cs336_basics.training.benchmark optimizer --num-layers 12 --d-model 768
+    python -m cs336_basics.training.benchmark optimizer-state --text data/TinyStoriesV2-GPT4-valid.txt
+"""
+
+import argparse
+
+import numpy as np
+import torch
+
+from cs336_basics.data.dataset import sample_windows
+from cs336_basics.model.benchmark import time_fn
+from cs336_basics.model.transformer import TransformerLM
+from cs336_basics.tokenizer.utils import print_color
+from cs336_basics.training.optimizer import AdamW, LowMemoryAdamW
+
+
+def benchmark_optimizer(num_layers: int, d_model: int, vocab_size: int, device: str = "cpu") -> dict:
+    """Time of one AdamW step on a transformer's parameters, per-parameter loop vs. foreach."""
+    model = TransformerLM(vocab_size, 256, d_model, num_layers, max(1, d_model // 64), 4 * d_model, device=device)
+    for p in model.parameters():
+        p.grad = torch.randn_like(p)
+    result = {"num_params": len(list(model.parameters()))}
+    for foreach in [False, True]:
+        opt = AdamW(model.parameters(), lr=1e-4, foreach=foreach)
+
+        def step():
+            opt.step()
+            if device.startswith("cuda"):
+                torch.cuda.synchronize()
+
+        result[f"{'foreach' if foreach else 'single'}_step_ms"] = time_fn(step, warmup=2, repeats=10) * 1e3
+    result["speedup"] = result["single_step_ms"] / result["foreach_step_ms"]
+    return result
+
+
+def optimizer_state_bytes(opt: torch.optim.Optimizer) -> int:
+    return sum(v.nbytes for state in opt.state.values() for v in state.values() if torch.is_tensor(v))
+
+
+def benchmark_optimizer_state(
+    text_path: str, steps: int, d_model: int, num_layers: int, device: str = "cpu"
+) -> dict:
+    """
+    Optimizer state memory and training losses of float32, bf16 and 8-bit
+    AdamW moments, training the same small byte-level model on the same
+    batches of `text_path` (e.g. TinyStories). Loss deviations from the
+    float32 run are taken step by step over the whole run.
+    """
+    tokens = np.fromfile(text_path, dtype=np.uint8)
+    vocab_size, context_length, batch_size = 256, 64, 8
+    result = {}
+    reference_losses = None
+    for state_format in ["float32", "bfloat16", "int8"]:
+        torch.manual_seed(0)
+        model = TransformerLM(
+            vocab_size, context_length, d_model, num_layers, max(1, d_model // 32), 4 * d_model, device=device
+        )
+        if state_format == "float32":
+            opt = AdamW(model.parameters(), lr=1e-3)
+        else:
+            opt = LowMemoryAdamW(model.parameters(), lr=1e-3, state_format=state_format)
+        generator = np.random.default_rng(0)
+        losses = []
+        for _ in range(steps):
+            batch = torch.from_numpy(sample_windows(tokens, batch_size, context_length, generator)).long()
+            batch = batch.to(device)
+            loss = model.loss(batch[:, :-1], batch[:, 1:])
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+            losses.append(loss.item())
+        losses = np.array(losses)
+        result[f"{state_format}_state_mb"] = optimizer_state_bytes(opt) / 2**20
+        # Average the last steps to smooth batch noise.
+        result[f"{state_format}_final_loss"] = losses[-100:].mean()
+        if reference_losses is None:
+            reference_losses = losses
+            continue
+        deviation = np.abs(losses - reference_losses)
+        result[f"{state_format}_max_loss_deviation"] = deviation.max()
+        result[f"{state_format}_mean_loss_deviation"] = deviation.mean()
+    return result
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    optimizer = subparsers.add_parser("optimizer", help="AdamW step time")
+    optimizer.add_argument("--num-layers", type=int, default=12)
+    optimizer.add_argument("--d-model", type=int, default=256)
+    optimizer.add_argument("--vocab-size", type=int, default=10000)
+    optimizer.add_argument("--device", default="cpu")
+
+    optimizer_state = subparsers.add_parser("optimizer-state", help="low-memory AdamW moments")
+    optimizer_state.add_argument("--text", default="tests/fixtures/tinystories_sample.txt")
+    optimizer_state.add_argument("--steps", type=int, default=2000)
+    optimizer_state.add_argument("--d-model", type=int, default=128)
+    optimizer_state.add_argument("--num-layers", type=int, default=2)
+    optimizer_state.add_argument("--device", default="cpu")
+
+    args = parser.parse_args(argv)
+    if args.command == "optimizer":
+        result = benchmark_optimizer(args.num_layers, args.d_model, args.vocab_size, args.device)
+    elif args.command == "optimizer-state":
+        result = benchmark_optimizer_state(args.text, args.steps, args.d_model, args.num_layers, args.device)
+    for name, value in result.items():
+        print_color(f"{name}: {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
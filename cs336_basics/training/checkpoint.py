@@ -0,0 +1,308 @@
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import IO, BinaryIO
+
+import torch
+
+MODEL_WEIGHTS = "model.pt"
+TRAINING_STATE = "training_state.pt"
+
+
+def checkpoint_state(
+    model: torch.nn.Module, optimizer: torch.optim.Optimizer, iteration: int, **stateful
+) -> dict:
+    """The dict `save_checkpoint` serializes; its tensors are the live ones, not copies."""
+    checkpoint = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "iteration": iteration,
+    }
+    for name, obj in stateful.items():
+        checkpoint[name] = obj.state_dict()
+    return checkpoint
+
+
+def save_checkpoint(
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    iteration: int,
+    out: str | os.PathLike | BinaryIO | IO[bytes],
+    **stateful,
+):
+    """
+    Serialize model, optimizer and iteration to `out`.
+
+    Any other object with `state_dict()` / `load_state_dict()` (e.g. an
+    `EpochSampler`) can be passed by keyword and is stored under that name.
+    """
+    torch.save(checkpoint_state(model, optimizer, iteration, **stateful), out)
+
+
+def load_checkpoint(
+    src: str | os.PathLike | BinaryIO | IO[bytes],
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    **stateful,
+) -> int:
+    """
+    Restore a checkpoint written by `save_checkpoint` into `model`, `optimizer`
+    and the keyword objects, and return the saved iteration.
+    """
+    checkpoint = torch.load(src, map_location="cpu", weights_only=True)
+    model.load_state_dict(checkpoint["model"])
+    optimizer.load_state_dict(checkpoint["optimizer"])
+    for name, obj in stateful.items():
+        if name not in checkpoint:
+            raise KeyError(f"Checkpoint has no state for {name!r}")
+        obj.load_state_dict(checkpoint[name])
+    return checkpoint["iteration"]
+
+
+def _copy_to_cpu(obj):
+    """Copy every tensor in a nest of dicts, lists and tuples to CPU memory."""
+    if torch.is_tensor(obj):
+        if obj.device.type == "cuda":
+            # Queue the copy on the current stream into pinned memory; later
+            # in-place updates are ordered after it, so training need not wait.
+            copy = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True)
+            copy.copy_(obj.detach(), non_blocking=True)
+            return copy
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _copy_to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_copy_to_cpu(value) for value in obj)
+    return obj
+
+
+def save_atomic(obj, path: str | os.PathLike):
+    """
+    `torch.save` to a temporary file next to `path`, then rename it into
+    place: a crash leaves either the previous file or the new one, never a
+    partial write. The directory is fsynced too, so the rename survives a
+    power loss.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path):
+    # A rename is only durable once the directory entry itself is on disk.
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save_split(checkpoint: dict, directory: Path):
+    tmp = directory.with_name(f".{directory.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    training_state = dict(checkpoint)
+    save_atomic(training_state.pop("model"), tmp / MODEL_WEIGHTS)
+    save_atomic(training_state, tmp / TRAINING_STATE)
+    # A directory cannot be renamed over a non-empty one, so an existing
+    # checkpoint is renamed aside first and only deleted once the new one is
+    # in place; `_restore_split` puts it back if we crash in between.
+    old = _aside_path(directory)
+    shutil.rmtree(old, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    _fsync_dir(directory.parent)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _aside_path(directory: Path) -> Path:
+    return directory.with_name(f".{directory.name}.old")
+
+
+def _restore_split(directory: Path):
+    """Undo a replacement of `directory` that was interrupted after moving it aside."""
+    old = _aside_path(directory)
+    if not directory.exists() and old.exists():
+        os.replace(old, directory)
+
+
+def save_split_checkpoint(
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    iteration: int,
+    directory: str | os.PathLike,
+    **stateful,
+):
+    """
+    Like `save_checkpoint`, but to a directory holding the model weights
+    (`model.pt`, a plain state dict) apart from everything else
+    (`training_state.pt`), so inference can read the weights alone with
+    `load_model_weights`. The directory is written under a temporary name
+    and renamed into place.
+    """
+    _save_split(checkpoint_state(model, optimizer, iteration, **stateful), Path(directory))
+
+
+def load_split_checkpoint(
+    directory: str | os.PathLike,
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    **stateful,
+) -> int:
+    """Restore a checkpoint written by `save_split_checkpoint` and return its iteration."""
+    directory = Path(directory)
+    _restore_split(directory)
+    load_model_weights(directory, model, assign=False)
+    training_state = torch.load(directory / TRAINING_STATE, map_location="cpu", weights_only=True)
+    optimizer.load_state_dict(training_state["optimizer"])
+    for name, obj in stateful.items():
+        if name not in training_state:
+            raise KeyError(f"Checkpoint has no state for {name!r}")
+        obj.load_state_dict(training_state[name])
+    return training_state["iteration"]
+
+
+def load_model_weights(
+    src: str | os.PathLike, model: torch.nn.Module | None = None, assign: bool = True
+) -> dict[str, torch.Tensor]:
+    """
+    Memory-map the weights of a `save_split_checkpoint` directory (or a
+    `model.pt` file) and return the state dict; nothing is read until a
+    tensor is first touched, and processes mapping the same file share its
+    page cache. With `model` given, they are also loaded into it. With
+    `assign=True` the model's parameters become the mapped tensors instead
+    of copies, so a model built on the meta device costs no weight memory
+    of its own:
+
+        with torch.device("meta"):
+            model = TransformerLM(...)
+        load_model_weights(checkpoint_dir, model)
+    """
+    src = Path(src)
+    _restore_split(src)
+    if src.is_dir():
+        src = src / MODEL_WEIGHTS
+    weights = torch.load(src, map_location="cpu", weights_only=True, mmap=True)
+    if model is not None:
+        model.load_state_dict(weights, assign=assign)
+    return weights
+
+
+class CheckpointManager:
+    """
+    Writes checkpoints in the background and keeps the most recent ones.
+
+    `save` copies the state to CPU memory (the only part training waits
+    for, plus any save still in flight) and writes it on a background
+    thread with `save_atomic` to `{directory}/{prefix}_{iteration:08d}.pt`,
+    in the format of `save_checkpoint`, or with `split=True` to a
+    `save_split_checkpoint` directory of that name without `.pt`. At most
+    one save is in flight; once a write finishes, only it and the
+    `keep_last - 1` checkpoints before it are kept. Checkpoints after it
+    (left by a run that was resumed from an older one) are deleted too, so
+    `latest` stays on the current run. Errors from the writer are raised by
+    the next `save`, `wait` or `close`.
+    """
+
+    def __init__(
+        self, directory: str | os.PathLike, keep_last: int = 3, prefix: str = "ckpt", split: bool = False
+    ) -> None:
+        if keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_last = keep_last
+        self.prefix = prefix
+        self.split = split
+        self._pattern = re.compile(rf"{re.escape(prefix)}_(\d+)(\.pt)?")
+        self._thread: threading.Thread | None = None
+        self._error: BaseException | None = None
+
+    def path(self, iteration: int) -> Path:
+        return self.directory / f"{self.prefix}_{iteration:08d}{'' if self.split else '.pt'}"
+
+    def _find(self) -> list[tuple[int, Path]]:
+        found = []
+        for p in self.directory.iterdir():
+            match = self._pattern.fullmatch(p.name)
+            if match:
+                found.append((int(match.group(1)), p))
+        return sorted(found)
+
+    def checkpoints(self) -> list[Path]:
+        """Finished checkpoints, oldest first."""
+        return [p for _, p in self._find()]
+
+    def latest(self) -> Path | None:
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, model: torch.nn.Module, optimizer: torch.optim.Optimizer, iteration: int, **stateful):
+        """Snapshot the state now and write it in the background; see `save_checkpoint`."""
+        self.wait()
+        snapshot = _copy_to_cpu(checkpoint_state(model, optimizer, iteration, **stateful))
+        done = None
+        if torch.cuda.is_initialized():
+            # The writer waits on this for the non-blocking device-to-host copies.
+            done = torch.cuda.Event()
+            done.record()
+        self._thread = threading.Thread(
+            target=self._write, args=(snapshot, iteration, done), name="checkpoint-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _write(self, snapshot: dict, iteration: int, done):
+        try:
+            if done is not None:
+                done.synchronize()
+            path = self.path(iteration)
+            if self.split:
+                _save_split(snapshot, path)
+            else:
+                save_atomic(snapshot, path)
+            found = self._find()
+            older = [p for i, p in found if i < iteration]
+            newer = [p for i, p in found if i > iteration]
+            for old in older[: max(0, len(older) - (self.keep_last - 1))] + newer:
+                if old.is_dir():
+                    shutil.rmtree(old, ignore_errors=True)
+                else:
+                    old.unlink(missing_ok=True)
+        except BaseException as e:
+            self._error = e
+
+    def wait(self):
+        """Block until the in-flight save (if any) is on disk."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background checkpoint save failed") from error
+
+    def load_latest(self, model: torch.nn.Module, optimizer: torch.optim.Optimizer, **stateful) -> int | None:
+        """Restore the newest checkpoint and return its iteration, or None if there is none."""
+        self.wait()
+        latest = self.latest()
+        if latest is None:
+            return None
+        if latest.is_dir():
+            return load_split_checkpoint(latest, model, optimizer, **stateful)
+        return load_checkpoint(latest, model, optimizer, **stateful)
+
+    def close(self):
+        self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
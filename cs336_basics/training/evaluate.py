@@ -0,0 +1,177 @@
+import hashlib
+import json
+import math
+import os
+from collections.abc import Callable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+import torch
+import torch.nn.functional as F
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def eval_windows(
+    num_tokens: int, context_length: int, stride: int | None = None
+) -> tuple[npt.NDArray, npt.NDArray]:
+    """
+    Windows of `context_length + 1` tokens that score every target exactly once.
+
+    Windows start every `stride` tokens (default: `context_length`, i.e. no
+    overlap), plus one flush with the end. A window only scores the targets
+    the previous window did not reach, so with a smaller stride every target
+    after the first window is predicted from at least
+    `context_length - stride` tokens of context.
+
+    Returns:
+        (starts, score_from): window start offsets and, per window, the index
+        of the first position whose target is scored
+    """
+    stride = stride or context_length
+    if not 0 < stride <= context_length:
+        raise ValueError(f"stride must be in (0, {context_length}], got {stride}")
+    last_start = num_tokens - 1 - context_length
+    if last_start < 0:
+        raise ValueError(
+            f"Dataset of {num_tokens} tokens is too short for context_length {context_length}"
+        )
+    starts = np.arange(0, last_start + 1, stride, dtype=np.int64)
+    if starts[-1] != last_start:
+        starts = np.append(starts, last_start)
+    # Window i covers targets starts[i] + 1 .. starts[i] + context_length.
+    prev_ends = np.concatenate(([0], starts[:-1] + context_length))
+    score_from = np.maximum(prev_ends - starts, 0)
+    return starts, score_from
+
+
+def iter_eval_batches(
+    tokens: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    stride: int | None = None,
+    device: str | torch.device = "cpu",
+) -> Iterator[tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+    """
+    Yield `(inputs, targets, mask)` batches in order over the whole of
+    `tokens`; `mask` marks the targets to score. The last batch is padded with
+    fully masked windows, so every batch has the same shape.
+    """
+    starts, score_from = eval_windows(len(tokens), context_length, stride)
+    windows = sliding_window_view(tokens, context_length + 1)
+    positions = np.arange(context_length)
+    for i in range(0, len(starts), batch_size):
+        batch_starts = starts[i : i + batch_size]
+        mask = positions >= score_from[i : i + batch_size, None]
+        if len(batch_starts) < batch_size:
+            num_pad = batch_size - len(batch_starts)
+            batch_starts = np.concatenate((batch_starts, np.repeat(batch_starts[-1:], num_pad)))
+            mask = np.concatenate((mask, np.zeros((num_pad, context_length), dtype=bool)))
+        batch = torch.from_numpy(windows[batch_starts].astype(np.int64)).to(device)
+        yield batch[:, :-1], batch[:, 1:], torch.from_numpy(mask).to(device)
+
+
+@torch.no_grad()
+def evaluate(
+    model: Callable[[torch.Tensor], torch.Tensor],
+    tokens: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    stride: int | None = None,
+    device: str | torch.device = "cpu",
+) -> dict:
+    """
+    Token-weighted mean cross-entropy and perplexity of `model` (ids -> logits)
+    over every target of `tokens`. Losses are summed on the device in float64
+    and only read back once at the end; the number of scored targets is
+    known from the windows up front.
+    """
+    _, score_from = eval_windows(len(tokens), context_length, stride)
+    num_tokens = int((context_length - score_from).sum())
+    was_training = getattr(model, "training", False)
+    if was_training:
+        model.eval()
+    loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+    try:
+        for inputs, targets, mask in iter_eval_batches(
+            tokens, batch_size, context_length, stride, device
+        ):
+            logits = model(inputs)
+            losses = F.cross_entropy(
+                logits.flatten(0, -2).float(), targets.flatten(), reduction="none"
+            )
+            loss_sum += losses.masked_fill(~mask.flatten(), 0).sum(dtype=torch.float64)
+    finally:
+        if was_training:
+            model.train()
+
+    loss = loss_sum.item() / num_tokens
+    return {"loss": loss, "perplexity": math.exp(loss), "num_tokens": num_tokens}
+
+
+def state_dict_hash(model: torch.nn.Module) -> str:
+    """Hash of every tensor of the model's state dict, identifying a checkpoint."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for name, tensor in sorted(model.state_dict().items()):
+        hasher.update(name.encode("utf-8"))
+        hasher.update(str(tensor.dtype).encode("utf-8"))
+        hasher.update(str(tuple(tensor.shape)).encode("utf-8"))
+        hasher.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy())
+    return hasher.hexdigest()
+
+
+def tokens_hash(tokens: npt.NDArray, num_samples: int = 1 << 16) -> str:
+    """
+    Hash of the length and `num_samples` evenly spaced ids of `tokens`
+    (including the first and last), identifying an eval set without reading
+    all of it.
+    """
+    num_samples = min(num_samples, len(tokens))
+    indices = np.unique(np.linspace(0, len(tokens) - 1, num_samples).astype(np.int64))
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(len(tokens)).encode("utf-8"))
+    hasher.update(np.asarray(tokens[indices], dtype="<i8").tobytes())
+    return hasher.hexdigest()
+
+
+def cached_evaluate(
+    model: torch.nn.Module,
+    tokens: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    stride: int | None = None,
+    device: str | torch.device = "cpu",
+    cache_path: str | os.PathLike | None = None,
+    dataset_name: str = "",
+) -> dict:
+    """
+    `evaluate`, but results are kept in the JSON file `cache_path`, keyed by
+    the model weights' hash, the eval set (`dataset_name` and `tokens_hash`)
+    and settings, so evaluating the same checkpoint twice costs one hash of
+    its weights.
+    """
+    if cache_path is None:
+        return evaluate(model, tokens, batch_size, context_length, stride, device)
+
+    key = "|".join(
+        [
+            state_dict_hash(model),
+            dataset_name,
+            tokens_hash(tokens),
+            str(context_length),
+            str(stride or context_length),
+        ]
+    )
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+    if key in cache:
+        return cache[key]
+
+    result = evaluate(model, tokens, batch_size, context_length, stride, device)
+    cache[key] = result
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    return result
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from collections.abc import Iterable
+
+import torch
+from jaxtyping import Float, Int
+from torch import Tensor
+
+IGNORE_INDEX = -100
+
+
+def cross_entropy(
+    logits: Float[Tensor, "... vocab_size"], targets: Int[Tensor, "..."]
+) -> Float[Tensor, ""]:
+    """Mean cross-entropy, with the log-sum-exp shifted by the row max for stability."""
+    logits = logits.float()
+    row_max = logits.amax(dim=-1, keepdim=True)
+    log_sum_exp = torch.log(torch.exp(logits - row_max).sum(dim=-1)) + row_max.squeeze(-1)
+    target_logits = logits.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+    return (log_sum_exp - target_logits).mean()
+
+
+class _ChunkedLinearCrossEntropy(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, hidden, weight, targets, chunk_size):
+        valid = targets != IGNORE_INDEX
+        num_valid = valid.sum().clamp(min=1)
+        log_sum_exp = hidden.new_full((hidden.shape[0],), float("-inf"), dtype=torch.float32)
+        target_logits = hidden.new_zeros(hidden.shape[0], dtype=torch.float32)
+        for start in range(0, weight.shape[0], chunk_size):
+            end = min(start + chunk_size, weight.shape[0])
+            logits = (hidden @ weight[start:end].T).float()
+            log_sum_exp = torch.logaddexp(log_sum_exp, torch.logsumexp(logits, dim=-1))
+            in_chunk = (targets >= start) & (targets < end)
+            local = (targets - start).clamp(0, end - start - 1)
+            target_logits += torch.where(in_chunk, logits.gather(-1, local[:, None]).squeeze(-1), 0)
+
+        loss = ((log_sum_exp - target_logits) * valid).sum() / num_valid
+        ctx.save_for_backward(hidden, weight, targets, log_sum_exp)
+        ctx.chunk_size = chunk_size
+        ctx.num_valid = num_valid
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_loss):
+        hidden, weight, targets, log_sum_exp = ctx.saved_tensors
+        valid = targets != IGNORE_INDEX
+        # d loss / d logits = (softmax - one_hot(target)) * grad / num_valid, per valid row.
+        scale = (grad_loss / ctx.num_valid) * valid.float()
+        grad_hidden = torch.zeros_like(hidden, dtype=torch.float32)
+        grad_weight = torch.zeros_like(weight, dtype=torch.float32)
+        for start in range(0, weight.shape[0], ctx.chunk_size):
+            end = min(start + ctx.chunk_size, weight.shape[0])
+            w = weight[start:end]
+            grad_logits = torch.exp((hidden @ w.T).float() - log_sum_exp[:, None])
+            in_chunk = (targets >= start) & (targets < end)
+            rows = in_chunk.nonzero().squeeze(-1)
+            grad_logits[rows, targets[rows] - start] -= 1
+            grad_logits *= scale[:, None]
+            grad_hidden += grad_logits @ w.float()
+            grad_weight[start:end] = grad_logits.T @ hidden.float()
+        return grad_hidden.to(hidden.dtype), grad_weight.to(weight.dtype), None, None
+
+
+def linear_cross_entropy(
+    hidden: Float[Tensor, "... d_model"],
+    weight: Float[Tensor, "vocab_size d_model"],
+    targets: Int[Tensor, "..."],
+    chunk_size: int = 8192,
+) -> Float[Tensor, ""]:
+    """
+    Mean cross-entropy of the logits `hidden @ weight.T`, without materializing them.
+
+    The vocabulary is processed `chunk_size` rows of `weight` at a time,
+    keeping only a running log-sum-exp and the target logit per token; the
+    backward pass recomputes each chunk of logits. Peak memory for logits
+    drops from (tokens, vocab_size) to (tokens, chunk_size). Targets equal to
+    `IGNORE_INDEX` are left out of the mean.
+    """
+    return _ChunkedLinearCrossEntropy.apply(
+        hidden.reshape(-1, hidden.shape[-1]), weight, targets.reshape(-1), chunk_size
+    )
+
+
+@torch.no_grad()
+def clip_grad_norm(
+    parameters: Iterable[torch.nn.Parameter], max_l2_norm: float, eps: float = 1e-6
+) -> Float[Tensor, ""]:
+    """
+    Scale the gradients of `parameters` in place so that their combined L2
+    norm is at most `max_l2_norm`, and return the norm before clipping.
+
+    Per-tensor norms come from `torch._foreach_norm` (one call per (device,
+    dtype) bucket) and are reduced on the device; the scale factor stays a
+    tensor, so nothing waits for the GPU unless the caller reads the returned
+    norm, e.g. with `.item()` for logging. Parameters without a gradient are
+    skipped.
+    """
+    buckets: dict[tuple, list[Tensor]] = defaultdict(list)
+    for p in parameters:
+        if p.grad is not None:
+            buckets[(p.grad.device, p.grad.dtype)].append(p.grad)
+    if not buckets:
+        return torch.tensor(0.0)
+
+    device = next(iter(buckets))[0]
+    norms = [
+        torch.stack(torch._foreach_norm(grads)).float().to(device).square().sum() for grads in buckets.values()
+    ]
+    total_norm = torch.stack(norms).sum().sqrt()
+    # min(1, max / (norm + eps)) leaves the gradients unchanged below the threshold.
+    scale = (max_l2_norm / (total_norm + eps)).clamp(max=1.0)
+    for (grad_device, _), grads in buckets.items():
+        torch._foreach_mul_(grads, scale.to(grad_device))
+    return total_norm
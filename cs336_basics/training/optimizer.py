@@ -0,0 +1,238 @@
+import math
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+
+import torch
+from torch import Tensor
+
+
+class AdamW(torch.optim.Optimizer):
+    """
+    Adam with decoupled weight decay (Loshchilov & Hutter, 2019), updating
+    parameters in the same order of operations as `torch.optim.AdamW`.
+
+    With `foreach=True` (the default) the parameters of a group are bucketed
+    by (device, dtype) and every bucket is updated with a handful of
+    `torch._foreach_*` calls instead of a Python loop of small kernels per
+    parameter. `foreach=False` is the plain per-parameter loop.
+    """
+
+    def __init__(
+        self,
+        params: Iterable[Tensor] | Iterable[dict],
+        lr: float = 1e-3,
+        betas: tuple[float, float] = (0.9, 0.999),
+        eps: float = 1e-8,
+        weight_decay: float = 0.01,
+        foreach: bool = True,
+    ) -> None:
+        if lr < 0:
+            raise ValueError(f"Invalid learning rate: {lr}")
+        if not (0 <= betas[0] < 1 and 0 <= betas[1] < 1):
+            raise ValueError(f"Invalid betas: {betas}")
+        defaults = {"lr": lr, "betas": betas, "eps": eps, "weight_decay": weight_decay, "foreach": foreach}
+        super().__init__(params, defaults)
+
+    def _init_state(self, p: Tensor) -> dict:
+        state = self.state[p]
+        if not state:
+            state["step"] = 0
+            state["exp_avg"] = torch.zeros_like(p, memory_format=torch.preserve_format)
+            state["exp_avg_sq"] = torch.zeros_like(p, memory_format=torch.preserve_format)
+        return state
+
+    @torch.no_grad()
+    def step(self, closure: Callable | None = None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for group in self.param_groups:
+            params = [p for p in group["params"] if p.grad is not None]
+            if any(p.grad.is_sparse for p in params):
+                raise RuntimeError("AdamW does not support sparse gradients")
+            if group["foreach"]:
+                buckets: dict[tuple, list[Tensor]] = defaultdict(list)
+                for p in params:
+                    buckets[(p.device, p.dtype)].append(p)
+                for bucket in buckets.values():
+                    self._foreach_update(group, bucket)
+            else:
+                for p in params:
+                    self._single_update(group, p)
+        return loss
+
+    def _single_update(self, group: dict, p: Tensor):
+        lr, (beta1, beta2), eps = group["lr"], group["betas"], group["eps"]
+        state = self._init_state(p)
+        state["step"] += 1
+        step = state["step"]
+        grad, exp_avg, exp_avg_sq = p.grad, state["exp_avg"], state["exp_avg_sq"]
+
+        p.mul_(1 - lr * group["weight_decay"])
+        exp_avg.lerp_(grad, 1 - beta1)
+        exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+        bias_correction1 = 1 - beta1**step
+        bias_correction2_sqrt = math.sqrt(1 - beta2**step)
+        denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(eps)
+        p.addcdiv_(exp_avg, denom, value=-lr / bias_correction1)
+
+    def _foreach_update(self, group: dict, params: list[Tensor]):
+        lr, (beta1, beta2), eps = group["lr"], group["betas"], group["eps"]
+        states = [self._init_state(p) for p in params]
+        grads = [p.grad for p in params]
+        exp_avgs = [s["exp_avg"] for s in states]
+        exp_avg_sqs = [s["exp_avg_sq"] for s in states]
+        # Steps can differ within a bucket (parameters that skipped a step without a
+        # gradient), so the bias corrections are per-parameter scalar lists.
+        for s in states:
+            s["step"] += 1
+        bias_correction2_sqrts = [math.sqrt(1 - beta2 ** s["step"]) for s in states]
+        step_sizes = [-lr / (1 - beta1 ** s["step"]) for s in states]
+
+        if group["weight_decay"]:
+            torch._foreach_mul_(params, 1 - lr * group["weight_decay"])
+        torch._foreach_lerp_(exp_avgs, grads, 1 - beta1)
+        torch._foreach_mul_(exp_avg_sqs, beta2)
+        torch._foreach_addcmul_(exp_avg_sqs, grads, grads, 1 - beta2)
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+        torch._foreach_div_(denoms, bias_correction2_sqrts)
+        torch._foreach_add_(denoms, eps)
+        torch._foreach_addcdiv_(params, exp_avgs, denoms, step_sizes)
+
+
+def quantize_blockwise(x: Tensor, block_size: int = 256, signed: bool = True) -> tuple[Tensor, Tensor]:
+    """
+    8-bit codes of `x` (flattened, zero-padded to whole blocks) with one float32
+    scale per block: int8 against the block's absmax if `signed`, else uint8
+    against its max (`x` must be non-negative). Non-zero unsigned values never
+    round down to 0.
+    """
+    flat = x.detach().reshape(-1).float()
+    flat = torch.nn.functional.pad(flat, (0, -len(flat) % block_size)).view(-1, block_size)
+    levels = 127 if signed else 255
+    scales = flat.abs().amax(dim=1) / levels
+    scales = torch.where(scales > 0, scales, torch.ones_like(scales))
+    codes = (flat / scales[:, None]).round()
+    if signed:
+        return codes.to(torch.int8).view(-1), scales
+    codes = torch.maximum(codes, (flat > 0).float())
+    return codes.to(torch.uint8).view(-1), scales
+
+
+def dequantize_blockwise(codes: Tensor, scales: Tensor, like: Tensor) -> Tensor:
+    """Float32 tensor shaped like `like` from `quantize_blockwise` output."""
+    values = codes.view(len(scales), -1).float() * scales[:, None]
+    return values.view(-1)[: like.numel()].view(like.shape)
+
+
+def stochastic_round_bf16(x: Tensor, seed: int) -> Tensor:
+    """
+    bf16 copy of `x` rounded up or down at random, with the probability of
+    rounding up equal to the dropped fraction of an ulp, so the result is
+    unbiased. Round-to-nearest loses every update smaller than half an ulp.
+    The noise is a hash of the element index and `seed`, so the rounding is
+    reproducible without any generator state to checkpoint.
+    """
+    mask = 0xFFFFFFFF
+    h = (torch.arange(x.numel(), device=x.device) + seed * 0x9E3779B9) & mask
+    for shift, multiplier in [(16, 0x7FEB352D), (15, 0x846CA68B)]:
+        h = ((h ^ (h >> shift)) * multiplier) & mask
+    noise = ((h ^ (h >> 16)) & 0xFFFF).to(torch.int32)
+    bits = x.float().contiguous().view(-1).view(torch.int32)
+    # bf16 is the upper half of float32: add noise below it, then truncate.
+    rounded = ((bits + noise) & -(1 << 16)).view(torch.float32).to(torch.bfloat16)
+    return rounded.view(x.shape)
+
+
+class LowMemoryAdamW(AdamW):
+    """
+    AdamW keeping both moments in less memory than the parameters.
+
+    `state_format="bfloat16"` stores the moments in bf16 (half of float32).
+    The second moment is stochastically rounded: with beta2 close to 1 its
+    per-step change is below half a bf16 ulp, and round-to-nearest would
+    freeze it.
+    `state_format="int8"` stores them blockwise-quantized with one float32
+    scale per `block_size` values: the first moment as int8, the second as
+    uint8 codes of its square root, which halves its dynamic range in log
+    space (about a quarter of float32 in total). Moments are expanded to
+    float32 one parameter at a time for the update, so this variant always
+    takes the per-parameter path.
+    """
+
+    STATE_FORMATS = ("bfloat16", "int8")
+
+    def __init__(
+        self,
+        params: Iterable[Tensor] | Iterable[dict],
+        lr: float = 1e-3,
+        betas: tuple[float, float] = (0.9, 0.999),
+        eps: float = 1e-8,
+        weight_decay: float = 0.01,
+        state_format: str = "bfloat16",
+        block_size: int = 256,
+    ) -> None:
+        if state_format not in self.STATE_FORMATS:
+            raise ValueError(f"Unknown state format {state_format!r}, expected one of {self.STATE_FORMATS}")
+        self.state_format = state_format
+        self.block_size = block_size
+        super().__init__(params, lr, betas, eps, weight_decay, foreach=False)
+
+    def _init_state(self, p: Tensor) -> dict:
+        state = self.state[p]
+        if not state:
+            state["step"] = 0
+            zeros = torch.zeros_like(p, dtype=torch.float32)
+            self._store_moments(state, zeros, zeros)
+        return state
+
+    def _load_moments(self, state: dict, p: Tensor) -> tuple[Tensor, Tensor]:
+        if self.state_format == "bfloat16":
+            return state["exp_avg"].float(), state["exp_avg_sq"].float()
+        exp_avg = dequantize_blockwise(state["exp_avg"], state["exp_avg_scale"], p)
+        exp_avg_sq = dequantize_blockwise(state["exp_avg_sq"], state["exp_avg_sq_scale"], p).square_()
+        return exp_avg, exp_avg_sq
+
+    def _store_moments(self, state: dict, exp_avg: Tensor, exp_avg_sq: Tensor):
+        if self.state_format == "bfloat16":
+            state["exp_avg"] = exp_avg.to(torch.bfloat16)
+            state["exp_avg_sq"] = stochastic_round_bf16(exp_avg_sq, seed=state["step"])
+            return
+        state["exp_avg"], state["exp_avg_scale"] = quantize_blockwise(exp_avg, self.block_size)
+        state["exp_avg_sq"], state["exp_avg_sq_scale"] = quantize_blockwise(
+            exp_avg_sq.sqrt(), self.block_size, signed=False
+        )
+
+    def _foreach_update(self, group: dict, params: list[Tensor]):
+        for p in params:
+            self._single_update(group, p)
+
+    def _single_update(self, group: dict, p: Tensor):
+        lr, (beta1, beta2), eps = group["lr"], group["betas"], group["eps"]
+        state = self._init_state(p)
+        state["step"] += 1
+        step = state["step"]
+        grad = p.grad.float()
+        exp_avg, exp_avg_sq = self._load_moments(state, p)
+
+        p.mul_(1 - lr * group["weight_decay"])
+        exp_avg.lerp_(grad, 1 - beta1)
+        exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+        bias_correction1 = 1 - beta1**step
+        bias_correction2_sqrt = math.sqrt(1 - beta2**step)
+        denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(eps)
+        p.add_((exp_avg / denom).to(p.dtype), alpha=-lr / bias_correction1)
+        self._store_moments(state, exp_avg, exp_avg_sq)
+
+    def load_state_dict(self, state_dict: dict):
+        super().load_state_dict(state_dict)
+        # The base class casts floating-point state to the parameter dtype;
+        # put back the stored bf16 moments and float32 scales unchanged.
+        saved_ids = [i for group in state_dict["param_groups"] for i in group["params"]]
+        params = [p for group in self.param_groups for p in group["params"]]
+        for saved_id, p in zip(saved_ids, params):
+            for key, value in state_dict["state"].get(saved_id, {}).items():
+                if torch.is_tensor(value) and key != "step":
+                    self.state[p][key] = value.to(p.device, copy=True)
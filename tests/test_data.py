@@ -3,6 +3,7 @@ from collections import Counter
 
 import numpy as np
 import pytest
+import torch
 
 from .adapters import run_get_batch
 
@@ -70,3 +71,186 @@ def test_get_batch():
             device="cuda:99",
         )
         assert "CUDA error" in str(excinfo.value) or "Torch not compiled with CUDA enabled" in str(excinfo.value)
+
+
+def test_token_dataset_memmap(tmp_path):
+    from cs336_basics.data.dataset import TokenDataset
+
+    path = tmp_path / "train.bin"
+    np.arange(0, 1000, dtype=np.uint16).tofile(path)
+    dataset = TokenDataset(path, context_length=16)
+    assert len(dataset) == 1000
+    assert isinstance(dataset.tokens, np.memmap)
+
+    x, y = dataset.get_batch(batch_size=8, generator=np.random.default_rng(0))
+    assert x.shape == y.shape == (8, 16)
+    assert x.dtype == y.dtype == torch.int64
+    np.testing.assert_array_equal((x + 1).numpy(), y.numpy())
+    np.testing.assert_array_equal(x[:, 1:].numpy(), x[:, :-1].numpy() + 1)
+
+    x2, _ = dataset.get_batch(batch_size=8, generator=np.random.default_rng(0))
+    assert torch.equal(x, x2)
+
+
+def test_prefetch_loader_reuses_buffers():
+    from cs336_basics.data.loader import PrefetchLoader
+
+    dataset = np.arange(0, 1000, dtype=np.uint16)
+    with PrefetchLoader(dataset, batch_size=4, context_length=8, prefetch_depth=2) as loader:
+        pointers = set()
+        for _ in range(20):
+            x, y = next(loader)
+            assert x.shape == y.shape == (4, 8)
+            assert x.dtype == torch.int64
+            np.testing.assert_array_equal((x + 1).numpy(), y.numpy())
+            pointers.add(x.data_ptr())
+        # Batches cycle through the fixed pool of prefetch_depth + 2 buffers.
+        assert len(pointers) <= 4
+        stats = loader.stats()
+    assert stats["num_batches"] == 20
+    assert stats["wait_time"] >= 0
+
+
+def test_shard_writer_picks_narrowest_dtype(tmp_path):
+    from cs336_basics.data.shard import ShardWriter, TokenShard
+
+    for vocab_size, dtype in [(256, np.uint8), (50_257, np.uint16), (100_000, np.uint32)]:
+        path = tmp_path / f"{vocab_size}.bin"
+        ids = np.array([0, vocab_size - 1, 7, vocab_size - 1, 3])
+        with ShardWriter(path, vocab_size, doc_separator_id=7) as writer:
+            writer.write(ids[:3])
+            writer.write(ids[3:])
+        shard = TokenShard(path)
+        assert shard.dtype == dtype
+        assert shard.tokens.tolist() == ids.tolist()
+        assert shard.doc_starts.tolist() == [0, 3]
+
+
+def test_shard_writer_leaves_interrupted_shard_unfinished(tmp_path):
+    from cs336_basics.data.dataset import TokenDataset
+    from cs336_basics.data.shard import ShardWriter, TokenShard
+
+    path = tmp_path / "shard.bin"
+    with pytest.raises(KeyboardInterrupt):
+        with ShardWriter(path, 256, doc_separator_id=7) as writer:
+            writer.write([1, 2, 7, 3])
+            raise KeyboardInterrupt
+    # The header is in place but unfinished, so readers refuse the shard
+    # instead of taking it for a headerless token file.
+    for open_shard in [TokenShard, lambda p: TokenDataset(p, context_length=2)]:
+        with pytest.raises(ValueError, match="unfinished"):
+            open_shard(path)
+
+    with ShardWriter(path, 256, doc_separator_id=7, resume_tokens=4) as writer:
+        writer.write([4])
+    shard = TokenShard(path)
+    assert shard.tokens.tolist() == [1, 2, 7, 3, 4]
+    assert shard.doc_starts.tolist() == [0, 3]
+
+
+def test_dataset_stats(tmp_path):
+    from cs336_basics.data.shard import ShardWriter
+    from cs336_basics.data.stats import dataset_stats
+
+    vocab = {0: b"a", 1: b"bc", 2: b"<|endoftext|>", 3: b"def"}
+    ids = np.array([0, 1, 1, 2, 0, 0, 0, 2, 1])
+    path = tmp_path / "train.bin"
+    with ShardWriter(path, vocab_size=4, doc_separator_id=2) as writer:
+        writer.write(ids)
+
+    report, counts = dataset_stats(path, vocab, window=2, special_tokens=["<|endoftext|>"])
+    assert counts.tolist() == [4, 3, 2, 0]
+    assert report["num_tokens"] == 9
+    assert report["unused_ids"] == [3]
+    # The two <|endoftext|> tokens are neither text bytes nor text tokens.
+    assert report["num_special_tokens"] == 2
+    assert report["num_bytes"] == 4 * 1 + 3 * 2
+    assert report["bytes_per_token"] == pytest.approx(10 / 7)
+    assert report["document_lengths"]["count"] == 3
+    assert report["document_lengths"]["max"] == 4
+
+    parallel_report, parallel_counts = dataset_stats(
+        path, vocab, window=2, num_workers=2, special_tokens=["<|endoftext|>"]
+    )
+    assert parallel_counts.tolist() == counts.tolist()
+    assert parallel_report == report
+
+
+def test_epoch_sampler_resumes_from_checkpoint(tmp_path):
+    from cs336_basics.data.sampler import EpochSampler
+    from cs336_basics.training.checkpoint import load_checkpoint, save_checkpoint
+
+    dataset = np.arange(0, 1000, dtype=np.uint16)
+    sampler = EpochSampler(dataset, batch_size=8, context_length=10, seed=3)
+
+    # One epoch visits every non-overlapping window exactly once.
+    num_windows = len(sampler._starts)
+    starts = np.concatenate([sampler.next_starts() for _ in range(num_windows // 8)])
+    assert len(set(starts.tolist())) == len(starts)
+    assert len(np.unique(starts % 10)) == 1
+
+    model = torch.nn.Linear(2, 2)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    save_checkpoint(model, optimizer, 7, tmp_path / "ckpt.pt", sampler=sampler)
+    # Crosses the epoch boundary.
+    expected = [sampler.get_batch() for _ in range(30)]
+
+    resumed = EpochSampler(dataset, batch_size=8, context_length=10, seed=0)
+    assert load_checkpoint(tmp_path / "ckpt.pt", model, optimizer, sampler=resumed) == 7
+    assert resumed.state_dict()["seed"] == 3
+    for x, y in expected:
+        x2, y2 = resumed.get_batch()
+        assert torch.equal(x, x2) and torch.equal(y, y2)
+        np.testing.assert_array_equal((x + 1).numpy(), y.numpy())
+
+
+def test_packed_dataset_keeps_documents_whole():
+    from cs336_basics.data.packing import IGNORE_INDEX, PackedDataset
+    from cs336_basics.model.attention import ATTENTION_BACKENDS, segment_attention_mask
+    from cs336_basics.model.transformer import TransformerLM
+
+    rng = np.random.default_rng(0)
+    doc_lengths = rng.integers(1, 40, size=200)
+    doc_starts = np.concatenate(([0], np.cumsum(doc_lengths)[:-1]))
+    # Token i of every document is 1000 * (document index) + i.
+    tokens = np.concatenate([1000 * d + np.arange(n) for d, n in enumerate(doc_lengths)])
+    dataset = PackedDataset(tokens, doc_starts, context_length=32)
+
+    stats = dataset.stats()
+    assert stats["num_tokens"] == len(tokens)
+    assert stats["efficiency"] > 0.95
+
+    inputs, targets, segment_ids, positions = dataset.get_rows(np.arange(len(dataset)))
+    real = segment_ids >= 0
+    assert int(real.sum()) == len(tokens)
+    assert sorted(inputs[real].tolist()) == sorted(tokens.tolist())
+    # Positions restart with every document and with every row-sized piece of a longer one.
+    np.testing.assert_array_equal(positions[real], inputs[real] % 1000 % 32)
+    same_doc = (inputs[:, 1:] // 1000 == inputs[:, :-1] // 1000) & real[:, 1:]
+    np.testing.assert_array_equal(targets[:, :-1][same_doc], inputs[:, 1:][same_doc])
+    assert (targets[:, :-1][~same_doc] == IGNORE_INDEX).all()
+
+    batch = dataset.get_batch(4, generator=np.random.default_rng(0))
+    mask = segment_attention_mask(batch.segment_ids)
+    assert mask.shape == (4, 32, 32)
+    assert not mask.triu(1).any()
+
+    # With segment ids, every document of a packed row sees only itself.
+    torch.manual_seed(0)
+    model = TransformerLM(vocab_size=200, context_length=32, d_model=32, num_layers=2, num_heads=4, d_ff=64)
+    row = dataset.get_rows(np.array([len(dataset) - 1]))
+    inputs, _, segment_ids, positions = (torch.from_numpy(a) for a in row)
+    inputs = inputs % 200
+    assert segment_ids.max() > 0
+    for backend in ATTENTION_BACKENDS:
+        for layer in model.layers:
+            layer.attn.attn_backend = backend
+        with torch.no_grad():
+            logits = model(inputs, positions, segment_ids=segment_ids)
+            for segment in range(int(segment_ids.max()) + 1):
+                in_segment = segment_ids[0] == segment
+                expected = model(inputs[:, in_segment])
+                assert torch.allclose(logits[:, in_segment], expected, atol=1e-5), backend
+
+    with pytest.raises(ValueError, match="no rows"):
+        PackedDataset(tokens[:0], doc_starts[:0], context_length=32).get_batch(4)
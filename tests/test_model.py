@@ -1,5 +1,8 @@
+import time
+
 from einops import rearrange
 import numpy
+import pytest
 import torch
 import torch.nn.functional as F
 
@@ -200,3 +203,234 @@ def test_silu_matches_pytorch():
     expected_output = F.silu(x)
     actual_output = run_silu(x)
     numpy.testing.assert_allclose(actual_output.detach().numpy(), expected_output.detach().numpy(), atol=1e-6)
+
+
+def test_score_texts_matches_unbatched():
+    from cs336_basics.model.scoring import score_texts
+    from cs336_basics.model.transformer import TransformerLM
+
+    class ByteTokenizer:
+        def encode(self, text):
+            return list(text.encode("utf-8"))
+
+    torch.manual_seed(0)
+    model = TransformerLM(
+        vocab_size=256, context_length=64, d_model=32, num_layers=2, num_heads=4, d_ff=64
+    )
+    texts = ["hello world", "a", "", "the quick brown fox jumps over the lazy dog", "hi there"] * 3
+    log_probs, stats = score_texts(model, ByteTokenizer(), texts, max_tokens=64, prefix_token=None)
+
+    for text, log_prob in zip(texts, log_probs):
+        ids = torch.tensor([list(text.encode("utf-8"))])
+        if ids.shape[1] < 2:
+            assert log_prob == 0.0
+            continue
+        with torch.no_grad():
+            expected = -F.cross_entropy(model(ids[:, :-1])[0], ids[0, 1:], reduction="sum").item()
+        assert abs(log_prob - expected) < 1e-3
+    assert stats["num_tokens"] == sum(len(t) for t in texts)
+    assert stats["tokens_per_second"] > 0
+
+
+def test_kv_cache_matches_full_forward():
+    from cs336_basics.model.transformer import TransformerLM
+
+    torch.manual_seed(0)
+    model = TransformerLM(
+        vocab_size=100, context_length=32, d_model=32, num_layers=2, num_heads=4, d_ff=64
+    )
+    ids = torch.randint(0, 100, (2, 20))
+    with torch.no_grad():
+        expected = model(ids)
+        cache = model.new_kv_cache(batch_size=2)
+        # A prompt, then one token at a time.
+        steps = [model(ids[:, :12], kv_cache=cache)]
+        steps += [model(ids[:, i : i + 1], kv_cache=cache) for i in range(12, 20)]
+    assert cache.length == 20
+    assert torch.allclose(torch.cat(steps, dim=1), expected, atol=1e-5)
+
+    # Left-padded prompt: padding slots are masked and positions start at the first real token.
+    num_pad = 5
+    padded = torch.cat([torch.zeros(1, num_pad, dtype=torch.long), ids[:1, :12]], dim=1)
+    positions = (torch.arange(padded.shape[1]) - num_pad).clamp(min=0)[None]
+    with torch.no_grad():
+        cache = model.new_kv_cache(batch_size=1)
+        cache.key_mask[:, :num_pad] = False
+        prefill = model(padded, positions, kv_cache=cache)
+        step = model(ids[:1, 12:13], positions[:, -1:] + 1, kv_cache=cache)
+    assert torch.allclose(prefill[:, num_pad:], expected[:1, :12], atol=1e-5)
+    assert torch.allclose(step[:, 0], expected[0, 12], atol=1e-5)
+
+    # Editing key_mask in place invalidates the memoized attention mask.
+    cache = model.new_kv_cache(batch_size=1)
+    cache.length = 6
+    full = cache.attention_mask(1)
+    assert cache.attention_mask(1) is full
+    cache.key_mask[:, :2] = False
+    masked = cache.attention_mask(1)
+    assert full[..., :2].all() and not masked[..., :2].any()
+
+
+def test_generation_engine_matches_greedy_decoding():
+    from cs336_basics.model.generation import GenerationEngine
+    from cs336_basics.model.transformer import TransformerLM
+    from cs336_basics.tokenizer.tokenizer import Tokenizer
+
+    vocab = {i: bytes([i]) for i in range(256)}
+    vocab[256] = b"<|endoftext|>"
+    tokenizer = Tokenizer(vocab, [], ["<|endoftext|>"])
+    torch.manual_seed(0)
+    model = TransformerLM(
+        vocab_size=257, context_length=48, d_model=32, num_layers=2, num_heads=4, d_ff=64
+    )
+    prompts = ["Once upon a time", "héllo", "a"]
+    engine = GenerationEngine(model, tokenizer)
+    outputs = engine.generate(prompts, max_new_tokens=20, temperature=0)
+
+    for prompt, output in zip(prompts, outputs):
+        ids = tokenizer.encode(prompt)
+        expected = []
+        with torch.no_grad():
+            for _ in range(20):
+                next_id = model(torch.tensor([ids]))[0, -1].argmax().item()
+                if next_id == 256:
+                    break
+                ids.append(next_id)
+                expected.append(next_id)
+        assert output == tokenizer.decode(expected)
+
+    stats = engine.stats()
+    assert stats["prefill_tokens"] == sum(len(p.encode("utf-8")) for p in prompts)
+    assert stats["decode_tokens_per_second"] > 0
+
+    # Time spent by the consumer between pieces is not decode time.
+    for _ in engine.stream(prompts, max_new_tokens=3, temperature=0):
+        time.sleep(0.05)
+    assert engine.stats()["decode_time"] < 0.05
+
+    sampled = engine.generate(prompts, max_new_tokens=5, temperature=0.8, top_k=10, top_p=0.9)
+    assert len(sampled) == len(prompts)
+    with pytest.raises(ValueError, match="top_p"):
+        engine.generate(prompts, max_new_tokens=5, top_p=0)
+
+    # An empty prompt is generated from the stop token, alone or next to others.
+    with torch.no_grad():
+        first = model(torch.tensor([[256]]))[0, -1].argmax().item()
+    for batch in [[""], ["", "a"]]:
+        output = engine.generate(batch, max_new_tokens=1, temperature=0)[0]
+        assert output == ("" if first == 256 else tokenizer.decode([first]))
+    with pytest.raises(ValueError, match="stop_token"):
+        GenerationEngine(model, tokenizer, stop_token=None).generate([""])
+
+
+def test_packed_attention_loads_separate_qkv_weights():
+    from cs336_basics.model.attention import MultiHeadSelfAttention
+    from cs336_basics.model.benchmark import naive_attention
+
+    torch.manual_seed(0)
+    d_model, num_heads = 32, 4
+    q_w, k_w, v_w, o_w = (torch.randn(d_model, d_model) / 6 for _ in range(4))
+    attn = MultiHeadSelfAttention(d_model, num_heads)
+    attn.load_state_dict(
+        {"q_proj.weight": q_w, "k_proj.weight": k_w, "v_proj.weight": v_w, "output_proj.weight": o_w}
+    )
+    assert list(attn.state_dict()) == ["qkv_proj.weight", "output_proj.weight"]
+
+    x = torch.randn(2, 10, d_model)
+    with torch.no_grad():
+        assert torch.allclose(attn(x), naive_attention(attn, q_w, k_w, v_w, x), atol=1e-5)
+
+
+def test_rope_tables_are_shared_and_grow():
+    from cs336_basics.model.attention import (
+        _ROPE_TABLES,
+        _ROPE_TABLES_MAX_ENTRIES,
+        RotaryPositionalEmbedding,
+        apply_rotary,
+        rope_tables,
+    )
+
+    first = RotaryPositionalEmbedding(10000.0, 16, 8)
+    second = RotaryPositionalEmbedding(10000.0, 16, 8)
+    x = torch.randn(2, 3, 20, 16)
+    cos, _ = rope_tables(16, 10000.0, 8)
+    assert second(x[..., :8, :]).shape == (2, 3, 8, 16)
+    assert rope_tables(16, 10000.0, 8)[0] is cos
+
+    # Position 19 is past max_seq_len, so the shared tables grow.
+    out = first(x)
+    assert len(rope_tables(16, 10000.0, 8)[0]) >= 20
+    positions = torch.arange(20)
+    assert torch.allclose(out, first(x, positions, num_positions=20))
+    # Without a bound, explicit positions past max_seq_len size the tables
+    # themselves; with one, they fail even though the cached tables are longer.
+    _ROPE_TABLES.clear()
+    assert torch.allclose(out, first(x, positions))
+    with pytest.raises(IndexError):
+        first(x, positions, num_positions=8)
+    assert torch.allclose(out[..., 5:, :], first(x[..., 5:, :], start=5))
+
+    cos, sin = rope_tables(16, 10000.0, 20)
+    rotated = apply_rotary(x.clone(), cos[:20], sin[:20], inplace=True)
+    assert torch.allclose(rotated, out, atol=1e-6)
+
+    # Equivalent device spellings share one entry, and old entries are evicted.
+    assert rope_tables(16, 10000.0, 8, torch.device("cpu"))[0] is cos
+    assert rope_tables(16, 10000.0, 8, "cpu")[0] is cos
+    for theta in range(1, 20):
+        rope_tables(4, float(theta), 8)
+    assert len(_ROPE_TABLES) <= _ROPE_TABLES_MAX_ENTRIES
+    assert rope_tables(16, 10000.0, 8)[0] is not cos
+
+
+def test_attention_backends_match_reference():
+    from cs336_basics.model.attention import scaled_dot_product_attention, tiled_causal_attention
+    from cs336_basics.model.transformer import TransformerLM
+
+    torch.manual_seed(0)
+    q = torch.randn(2, 3, 37, 16)
+    k, v = torch.randn(2, 3, 50, 16), torch.randn(2, 3, 50, 16)
+    key_mask = torch.rand(2, 1, 50) > 0.2
+    # Queries are the last 37 positions of the 50 keys.
+    mask = (torch.arange(50)[None, :] <= torch.arange(13, 50)[:, None]) & key_mask[..., None, :]
+    expected = scaled_dot_product_attention(q, k, v, mask)
+    actual = tiled_causal_attention(q, k, v, key_mask, block_size=8)
+    visible = mask.any(dim=-1, keepdim=True)
+    assert torch.allclose(actual, torch.where(visible, expected, 0), atol=1e-5)
+
+    ids = torch.randint(0, 100, (2, 24))
+    outputs = {}
+    for backend in ["reference", "torch", "tiled"]:
+        torch.manual_seed(0)
+        model = TransformerLM(100, 32, 32, 2, 4, 64, attn_backend=backend)
+        with torch.no_grad():
+            cache = model.new_kv_cache(2)
+            cache.key_mask[1, :3] = False
+            incremental = torch.cat([model(ids[:, :16], kv_cache=cache), model(ids[:, 16:], kv_cache=cache)], 1)
+            outputs[backend] = (model(ids), incremental)
+    for backend in ["torch", "tiled"]:
+        assert torch.allclose(outputs[backend][0], outputs["reference"][0], atol=1e-4)
+        # Outputs at the three padding slots of row 1 are never used.
+        incremental, reference = outputs[backend][1], outputs["reference"][1]
+        assert torch.allclose(incremental[0], reference[0], atol=1e-4)
+        assert torch.allclose(incremental[1, 3:], reference[1, 3:], atol=1e-4)
+
+
+def test_activation_checkpointing_keeps_gradients():
+    from cs336_basics.model.benchmark import saved_activation_bytes
+    from cs336_basics.model.transformer import TransformerLM
+
+    ids = torch.randint(0, 100, (2, 17))
+    results = {}
+    for every in [0, 1, 2]:
+        torch.manual_seed(0)
+        model = TransformerLM(100, 16, 32, 4, 4, 64, checkpoint_every=every)
+        loss, saved = saved_activation_bytes(lambda: model.loss(ids[:, :-1], ids[:, 1:]))
+        loss.backward()
+        results[every] = (loss.item(), [p.grad for p in model.parameters()], saved)
+
+    for every in [1, 2]:
+        assert results[every][0] == results[0][0]
+        for grad, expected in zip(results[every][1], results[0][1]):
+            assert torch.allclose(grad, expected, atol=1e-6)
+    assert results[1][2] < results[2][2] < results[0][2]
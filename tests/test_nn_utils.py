@@ -87,3 +87,49 @@ def test_gradient_clipping():
             t1_c_grad.detach().numpy(),
             atol=1e-6,
         )
+
+
+def test_linear_cross_entropy_matches_full_logits():
+    from cs336_basics.training.nn_utils import IGNORE_INDEX, linear_cross_entropy
+
+    torch.manual_seed(0)
+    hidden = torch.randn(3, 7, 16, dtype=torch.float64, requires_grad=True)
+    weight = torch.randn(50, 16, dtype=torch.float64, requires_grad=True)
+    targets = torch.randint(0, 50, (3, 7))
+    targets[0, :3] = IGNORE_INDEX
+
+    expected = F.cross_entropy((hidden @ weight.T).flatten(0, 1), targets.flatten(), ignore_index=IGNORE_INDEX)
+    expected_grads = torch.autograd.grad(expected, (hidden, weight))
+    # A chunk size that does not divide the vocabulary.
+    actual = linear_cross_entropy(hidden, weight, targets, chunk_size=16)
+    actual_grads = torch.autograd.grad(actual, (hidden, weight))
+
+    numpy.testing.assert_allclose(actual.item(), expected.item(), rtol=1e-6)
+    for a, e in zip(actual_grads, expected_grads):
+        numpy.testing.assert_allclose(a.numpy(), e.numpy(), atol=1e-6)
+
+
+def test_clip_grad_norm_returns_pre_clip_norm():
+    from cs336_basics.training.nn_utils import clip_grad_norm
+
+    torch.manual_seed(0)
+    params = [torch.nn.Parameter(torch.randn(4, 3)) for _ in range(3)]
+    params.append(torch.nn.Parameter(torch.randn(5, dtype=torch.float64)))
+    for p in params:
+        p.grad = torch.randn_like(p)
+    expected_params = [torch.nn.Parameter(torch.clone(p)) for p in params]
+    for p, q in zip(params, expected_params):
+        q.grad = torch.clone(p.grad)
+    expected_norm = clip_grad_norm_(expected_params, 1.0)
+
+    norm = clip_grad_norm(params, 1.0)
+    assert norm.dim() == 0
+    numpy.testing.assert_allclose(norm.item(), expected_norm.item(), rtol=1e-6)
+    for p, q in zip(params, expected_params):
+        numpy.testing.assert_allclose(p.grad.numpy(), q.grad.numpy(), atol=1e-6)
+
+    # Below the threshold the gradients are left as they are.
+    before = [torch.clone(p.grad) for p in params]
+    clip_grad_norm(params, 10.0)
+    for p, grad in zip(params, before):
+        assert torch.equal(p.grad, grad)
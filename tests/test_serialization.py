@@ -119,3 +119,88 @@ def test_checkpointing(tmp_path):
         )
     # compare the optimizer state dicts
     assert are_optimizers_equal(original_optimizer_state, new_optimizer_state)
+
+
+def test_checkpoint_manager_keeps_last_snapshots(tmp_path):
+    from cs336_basics.training.checkpoint import CheckpointManager
+
+    torch.manual_seed(0)
+    model = _TestNet()
+    optimizer = get_adamw_cls()(model.parameters(), lr=1e-3)
+    with CheckpointManager(tmp_path / "ckpts", keep_last=2) as manager:
+        assert manager.load_latest(model, optimizer) is None
+        for it in range(1, 5):
+            optimizer.zero_grad()
+            model(torch.rand(100)).square().sum().backward()
+            optimizer.step()
+            saved = {k: torch.clone(v) for k, v in model.state_dict().items()}
+            manager.save(model, optimizer, it)
+            # Changes after `save` returns are not part of the checkpoint.
+            with torch.no_grad():
+                for p in model.parameters():
+                    p.add_(1.0)
+
+    assert [p.name for p in manager.checkpoints()] == ["ckpt_00000003.pt", "ckpt_00000004.pt"]
+    assert sorted(p.name for p in (tmp_path / "ckpts").iterdir()) == ["ckpt_00000003.pt", "ckpt_00000004.pt"]
+
+    new_model = _TestNet()
+    new_optimizer = get_adamw_cls()(new_model.parameters(), lr=1e-3)
+    assert manager.load_latest(new_model, new_optimizer) == 4
+    for key, value in new_model.state_dict().items():
+        assert torch.equal(value, saved[key])
+    assert run_load_checkpoint(manager.latest(), new_model, new_optimizer) == 4
+
+    # A run resumed from an older checkpoint keeps its own save, not the
+    # later ones of the run it replaced.
+    with CheckpointManager(tmp_path / "ckpts", keep_last=2) as manager:
+        manager.save(model, optimizer, 2)
+        manager.wait()
+        assert [p.name for p in manager.checkpoints()] == ["ckpt_00000002.pt"]
+        manager.save(model, optimizer, 3)
+    assert [p.name for p in manager.checkpoints()] == ["ckpt_00000002.pt", "ckpt_00000003.pt"]
+
+
+def test_split_checkpoint_maps_weights_without_optimizer_state(tmp_path):
+    from cs336_basics.model.transformer import TransformerLM
+    from cs336_basics.training.checkpoint import (
+        CheckpointManager,
+        load_model_weights,
+        load_split_checkpoint,
+        save_split_checkpoint,
+    )
+
+    torch.manual_seed(0)
+    model = TransformerLM(100, 16, 32, 2, 4, 64)
+    optimizer = get_adamw_cls()(model.parameters(), lr=1e-3)
+    ids = torch.randint(0, 100, (2, 17))
+    model.loss(ids[:, :-1], ids[:, 1:]).backward()
+    optimizer.step()
+    save_split_checkpoint(model, optimizer, 5, tmp_path / "ckpt")
+    assert sorted(p.name for p in (tmp_path / "ckpt").iterdir()) == ["model.pt", "training_state.pt"]
+
+    # Weights alone, memory-mapped into a model built without storage.
+    with torch.device("meta"):
+        inference_model = TransformerLM(100, 16, 32, 2, 4, 64)
+    weights = load_model_weights(tmp_path / "ckpt", inference_model)
+    assert set(weights) == set(model.state_dict())
+    assert inference_model.lm_head.weight.data_ptr() == weights["lm_head.weight"].data_ptr()
+    with torch.no_grad():
+        assert torch.equal(inference_model(ids), model(ids))
+
+    new_model = TransformerLM(100, 16, 32, 2, 4, 64)
+    new_optimizer = get_adamw_cls()(new_model.parameters(), lr=1e-3)
+    assert load_split_checkpoint(tmp_path / "ckpt", new_model, new_optimizer) == 5
+    assert are_optimizers_equal(optimizer.state_dict(), new_optimizer.state_dict())
+
+    # Saving over a checkpoint swaps it whole; one interrupted after moving the
+    # old directory aside is put back when loading.
+    save_split_checkpoint(model, optimizer, 6, tmp_path / "ckpt")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ckpt"]
+    (tmp_path / "ckpt").rename(tmp_path / ".ckpt.old")
+    assert load_split_checkpoint(tmp_path / "ckpt", new_model, new_optimizer) == 6
+
+    with CheckpointManager(tmp_path / "managed", keep_last=1, split=True) as manager:
+        manager.save(model, optimizer, 1)
+        manager.save(model, optimizer, 2)
+    assert [p.name for p in (tmp_path / "managed").iterdir()] == ["ckpt_00000002"]
+    assert manager.load_latest(new_model, new_optimizer) == 2
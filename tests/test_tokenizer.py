@@ -462,3 +462,270 @@ def _encode(tokenizer, text):
     for just this function. We set the memory limit to 1MB.
     """
     return tokenizer.encode(text)
+
+
+def test_encode_file_to_bin_multiple_compressed_files(tmp_path):
+    import gzip
+
+    from cs336_basics.data.shard import TokenShard
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    text = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8")
+    lines = text.splitlines(keepends=True)
+    (tmp_path / "a.txt").write_text("".join(lines[: len(lines) // 2]), encoding="utf-8")
+    (tmp_path / "b.txt.gz").write_bytes(gzip.compress("".join(lines[len(lines) // 2 :]).encode("utf-8")))
+
+    out_path = tmp_path / "out.bin"
+    encode_file_to_bin(tokenizer, [tmp_path / "a.txt", tmp_path / "b.txt.gz"], out_path, num_workers=2)
+    ids = TokenShard(out_path).tokens.tolist()
+    assert ids == [i for line in lines for i in tokenizer.encode(line)]
+    assert not list(tmp_path.glob("*.part*"))
+
+
+def test_encode_file_to_bin_writes_shard(tmp_path):
+    import numpy as np
+
+    from cs336_basics.data.dataset import TokenDataset
+    from cs336_basics.data.shard import TokenShard, tokenizer_hash
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    out_path = tmp_path / "out.bin"
+    encode_file_to_bin(tokenizer, FIXTURES_PATH / "tinystories_sample.txt", out_path)
+
+    shard = TokenShard(out_path)
+    # 50257 ids fit in uint16; the header records everything needed to read the shard back.
+    assert shard.dtype == np.uint16
+    assert shard.vocab_size == 50257
+    assert shard.tokenizer_hash == tokenizer_hash(tokenizer)
+    with open(FIXTURES_PATH / "tinystories_sample.txt", encoding="utf-8") as f:
+        expected = [i for line in f for i in tokenizer.encode(line)]
+    assert shard.tokens.tolist() == expected
+
+    eot = tokenizer.encode("<|endoftext|>")[0]
+    expected_starts = [0] + [i + 1 for i, t in enumerate(expected) if t == eot and i + 1 < len(expected)]
+    assert shard.doc_starts.tolist() == expected_starts
+
+    dataset = TokenDataset(out_path, context_length=16)
+    x, y = dataset.get_batch(batch_size=8, document_aligned=True)
+    valid_starts = {tuple(expected[s : s + 16]) for s in expected_starts}
+    assert all(tuple(row) in valid_starts for row in x.tolist())
+
+
+def test_encode_file_to_bin_resumes_from_journal(tmp_path):
+    from cs336_basics.data.shard import TokenShard
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    text = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8")
+    (tmp_path / "a.txt").write_text(text.replace("\n", "\r\n"), encoding="utf-8")
+    (tmp_path / "b.txt").write_text(text, encoding="utf-8")
+    inputs = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    encode_file_to_bin(tokenizer, inputs, tmp_path / "reference.bin", num_workers=1)
+    assert not (tmp_path / "reference.bin.journal").exists()
+
+    class Crash(Exception):
+        pass
+
+    encode = tokenizer.encode
+    calls = 0
+    crash_at = 40
+
+    def flaky_encode(line):
+        nonlocal calls
+        calls += 1
+        if calls == crash_at:
+            raise Crash
+        return encode(line)
+
+    tokenizer.encode = flaky_encode
+    with pytest.raises(Crash):
+        encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, journal_interval=100)
+    assert (tmp_path / "out.bin.journal").exists()
+
+    # The resumed run only encodes the lines after the last journal entry.
+    calls, crash_at = 0, None
+    encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, journal_interval=100)
+    assert calls < 40
+    reference, resumed = TokenShard(tmp_path / "reference.bin"), TokenShard(tmp_path / "out.bin")
+    assert resumed.tokens.tolist() == reference.tokens.tolist()
+    assert resumed.doc_starts.tolist() == reference.doc_starts.tolist()
+    assert not (tmp_path / "out.bin.journal").exists()
+
+
+def test_encode_file_to_bin_small_blocks_match_single_block(tmp_path):
+    import gzip
+    import json
+
+    from cs336_basics.data.shard import TokenShard
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    text = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8")
+    (tmp_path / "a.txt").write_text(text.replace("\n", "\r\n") + "héllo wörld\n", encoding="utf-8")
+    (tmp_path / "b.txt.gz").write_bytes(gzip.compress(text.encode("utf-8")))
+    inputs = [tmp_path / "a.txt", tmp_path / "b.txt.gz"]
+    encode_file_to_bin(tokenizer, inputs, tmp_path / "whole.bin", num_workers=1)
+    expected = TokenShard(tmp_path / "whole.bin").tokens.tolist()
+
+    encode_file_to_bin(tokenizer, inputs, tmp_path / "blocks.bin", num_workers=1, block_size=64)
+    assert TokenShard(tmp_path / "blocks.bin").tokens.tolist() == expected
+
+    class Crash(Exception):
+        pass
+
+    encode = tokenizer.encode
+    calls = 0
+
+    def flaky_encode(line):
+        nonlocal calls
+        calls += 1
+        if calls == 15:
+            raise Crash
+        return encode(line)
+
+    tokenizer.encode = flaky_encode
+    with pytest.raises(Crash):
+        encode_file_to_bin(
+            tokenizer, inputs, tmp_path / "out.bin", num_workers=1, block_size=64, journal_interval=1
+        )
+    # Every block ends in an entry, so the run resumes mid-file at a block boundary.
+    last = json.loads((tmp_path / "out.bin.journal").read_text().splitlines()[-1])
+    assert last["file_index"] == 0 and last["input_offset"] > 0
+
+    tokenizer.encode = encode
+    encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, block_size=64, journal_interval=1)
+    assert TokenShard(tmp_path / "out.bin").tokens.tolist() == expected
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_encode_file_to_bin_skips_duplicate_documents(tmp_path, num_workers):
+    from cs336_basics.data.shard import TokenShard
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    docs = ["Once upon a time.\nThe end.\n", "\nA dog ran.\n", "\nA cat sat.\n", "\nOnce upon a time."]
+    eot = "<|endoftext|>"
+    (tmp_path / "a.txt").write_text(docs[0] + eot + docs[1] + eot + docs[1] + eot, encoding="utf-8")
+    (tmp_path / "b.txt").write_text(docs[2] + eot + docs[1] + eot + docs[3], encoding="utf-8")
+    inputs = [tmp_path / "a.txt", tmp_path / "b.txt"]
+
+    stats = encode_file_to_bin(
+        tokenizer,
+        inputs,
+        tmp_path / "out.bin",
+        num_workers=num_workers,
+        dedup=True,
+        dedup_hashes=tmp_path / "hashes.npy",
+    )
+    kept = [docs[0] + eot, docs[1] + eot, docs[2] + eot, docs[3]]
+    expected = [i for doc in kept for i in tokenizer.encode(doc)]
+    assert TokenShard(tmp_path / "out.bin").tokens.tolist() == expected
+    assert stats["num_tokens"] == len(expected)
+    assert stats["num_duplicate_docs"] == 2
+    assert stats["num_duplicate_tokens"] == 2 * len(tokenizer.encode(docs[1] + eot))
+    assert not list(tmp_path.glob("out.bin.*"))
+
+    # A later run that shares the hash set drops everything it has seen already.
+    stats = encode_file_to_bin(
+        tokenizer,
+        inputs,
+        tmp_path / "again.bin",
+        num_workers=num_workers,
+        dedup=True,
+        dedup_hashes=tmp_path / "hashes.npy",
+    )
+    assert stats["num_tokens"] == 0
+    assert stats["num_duplicate_docs"] == 6
+
+
+def test_encode_file_to_bin_resumes_dedup_from_hash_deltas(tmp_path):
+    import json
+
+    from cs336_basics.data.shard import TokenShard
+    from cs336_basics.tokenizer.tokenizer import encode_file_to_bin
+
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=["<|endoftext|>"],
+    )
+    eot = "<|endoftext|>"
+    docs = [f"\nStory {i % 7} about a dog.\nIt ran.\n" for i in range(40)]
+    inputs = [tmp_path / f"{i}.txt" for i in range(4)]
+    for i, path in enumerate(inputs):
+        path.write_text(eot.join(docs[10 * i : 10 * i + 10]) + eot, encoding="utf-8")
+    reference = encode_file_to_bin(tokenizer, inputs, tmp_path / "reference.bin", num_workers=1, dedup=True)
+
+    class Crash(Exception):
+        pass
+
+    encode = tokenizer.encode
+    calls = 0
+
+    def flaky_encode(text):
+        nonlocal calls
+        calls += 1
+        if calls == 100:
+            raise Crash
+        return encode(text)
+
+    tokenizer.encode = flaky_encode
+    with pytest.raises(Crash):
+        encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, dedup=True)
+    # One base snapshot and one append-only delta, however many entries were journaled.
+    assert sorted(p.name for p in tmp_path.glob("out.bin.dedup*")) == [
+        "out.bin.dedup-base.npy",
+        "out.bin.dedup-delta.bin",
+    ]
+    lines = (tmp_path / "out.bin.journal").read_text().splitlines()
+    counts = [json.loads(line)["dedup_delta_digests"] for line in lines[1:]]
+    assert len(counts) > 1 and counts == sorted(counts)
+    assert (tmp_path / "out.bin.dedup-delta.bin").stat().st_size >= 8 * counts[-1]
+
+    tokenizer.encode = encode
+    stats = encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, dedup=True)
+    assert stats == reference
+    expected = TokenShard(tmp_path / "reference.bin").tokens.tolist()
+    assert TokenShard(tmp_path / "out.bin").tokens.tolist() == expected
+    assert not list(tmp_path.glob("out.bin.*"))
+
+    # A crash while cleaning up leaves the hash set files but no journal, so
+    # the next run starts over instead of resuming from them.
+    from cs336_basics.tokenizer.dedup import HashSetJournal
+
+    def crash(self):
+        raise Crash
+
+    remove, HashSetJournal.remove = HashSetJournal.remove, crash
+    try:
+        with pytest.raises(Crash):
+            encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=1, dedup=True)
+    finally:
+        HashSetJournal.remove = remove
+    assert not (tmp_path / "out.bin.journal").exists()
+    stats = encode_file_to_bin(tokenizer, inputs, tmp_path / "out.bin", num_workers=2, dedup=True)
+    assert stats == reference
+    assert TokenShard(tmp_path / "out.bin").tokens.tolist() == expected
+    assert not list(tmp_path.glob("out.bin.*"))
@@ -86,3 +86,88 @@ def test_train_bpe_special_tokens(snapshot):
             "merges": merges,
         },
     )
+
+
+def test_train_bpe_multiple_compressed_files(tmp_path):
+    """
+    Training on the same corpus split over several files, some of them
+    gzip/xz-compressed, must give the same merges as training on the single file.
+    """
+    import gzip
+    import lzma
+
+    text = (FIXTURES_PATH / "corpus.en").read_bytes()
+    first_cut = text.index(b"\nT", len(text) // 3)
+    second_cut = text.index(b"\nT", 2 * len(text) // 3)
+    (tmp_path / "part0.txt.gz").write_bytes(gzip.compress(text[:first_cut]))
+    (tmp_path / "part1.txt").write_bytes(text[first_cut:second_cut])
+    (tmp_path / "part2.txt.xz").write_bytes(lzma.compress(text[second_cut:]))
+
+    _, reference_merges = run_train_bpe(
+        input_path=FIXTURES_PATH / "corpus.en",
+        vocab_size=500,
+        special_tokens=["<|endoftext|>"],
+    )
+    _, merges = run_train_bpe(
+        input_path=str(tmp_path / "part*"),
+        vocab_size=500,
+        special_tokens=["<|endoftext|>"],
+    )
+    assert merges == reference_merges
+
+
+def test_train_bpe_from_shard_count_files(tmp_path):
+    """
+    Counting two shards separately and running merge-train over the count
+    files must give the same tokenizer as training in one go.
+    """
+    from cs336_basics.tokenizer.shard_counts import main
+
+    input_path = FIXTURES_PATH / "corpus.en"
+    for shard_index in range(2):
+        main(
+            [
+                "count",
+                str(input_path),
+                "--special-tokens",
+                "<|endoftext|>",
+                "--num-shards",
+                "2",
+                "--shard-index",
+                str(shard_index),
+                "--out",
+                str(tmp_path / f"shard-{shard_index}.counts"),
+            ]
+        )
+    main(["merge-train", str(tmp_path / "*.counts"), "--vocab-size", "500", "--save-path", str(tmp_path / "tok")])
+
+    vocab, merges = run_train_bpe(
+        input_path=input_path,
+        vocab_size=500,
+        special_tokens=["<|endoftext|>"],
+    )
+    merges_lines = (tmp_path / "tok" / "merges.txt").read_text().splitlines()[1:]
+    assert merges_lines == [f"{a.decode('latin1')} {b.decode('latin1')}" for a, b in merges]
+    assert json.loads((tmp_path / "tok" / "vocab.json").read_text()) == {
+        v.decode("latin1"): k for k, v in vocab.items()
+    }
+    assert (tmp_path / "tok" / "special_tokens.txt").read_text() == "<|endoftext|>\n"
+
+
+def test_count_pre_tokens_splits_compressed_files_into_blocks(tmp_path):
+    """
+    A compressed file is decompressed once and handed to the workers in
+    blocks; the counts must not depend on the block size.
+    """
+    import gzip
+
+    from cs336_basics.tokenizer.tokenizer import count_pre_tokens
+
+    input_path = FIXTURES_PATH / "corpus.en"
+    (tmp_path / "corpus.en.gz").write_bytes(gzip.compress(input_path.read_bytes()))
+
+    reference = count_pre_tokens(input_path, ["<|endoftext|>"], num_workers=2)
+    counts = count_pre_tokens(
+        tmp_path / "corpus.en.gz", ["<|endoftext|>"], num_workers=2, block_size=4096
+    )
+    assert counts == reference
@@ -0,0 +1,39 @@
+import math
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+
+def test_evaluate_scores_every_target_once(tmp_path):
+    from cs336_basics.training.evaluate import cached_evaluate, evaluate
+
+    torch.manual_seed(0)
+    vocab_size = 17
+    # A bigram model: the loss of a target does not depend on the context, so
+    # every stride must give the loss over all consecutive pairs.
+    model = torch.nn.Sequential(torch.nn.Embedding(vocab_size, 8), torch.nn.Linear(8, vocab_size))
+    tokens = np.random.default_rng(0).integers(0, vocab_size, size=203).astype(np.uint16)
+    ids = torch.from_numpy(tokens.astype(np.int64))
+    with torch.no_grad():
+        expected = F.cross_entropy(model(ids[:-1]), ids[1:]).item()
+
+    for stride in [None, 5, 16]:
+        result = evaluate(model, tokens, batch_size=3, context_length=16, stride=stride)
+        assert result["num_tokens"] == len(tokens) - 1
+        assert result["loss"] == pytest.approx(expected, rel=1e-5)
+        assert result["perplexity"] == pytest.approx(math.exp(expected), rel=1e-5)
+
+    calls = []
+    model.register_forward_hook(lambda *_: calls.append(1))
+    cache_path = tmp_path / "eval.json"
+    first = cached_evaluate(model, tokens, 3, 16, cache_path=cache_path, dataset_name="valid")
+    num_calls = len(calls)
+    assert cached_evaluate(model, tokens, 3, 16, cache_path=cache_path, dataset_name="valid") == first
+    assert len(calls) == num_calls
+
+    # A different eval set of the same length is not served from the cache.
+    other = tokens[::-1].copy()
+    assert cached_evaluate(model, other, 3, 16, cache_path=cache_path, dataset_name="valid") != first
+    assert len(calls) > num_calls